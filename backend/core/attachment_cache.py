@@ -0,0 +1,184 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from core.extractors import ExtractedText
+from core.logger import setup_logger
+
+logger = setup_logger('attachment_cache')
+
+
+class AttachmentTextCache:
+    """
+    On-disk cache of extracted attachment text, keyed by attachment id and version.
+
+    Entries are the JSON-lines segment files produced by the extractor, so a hit
+    costs neither a download nor a parse. An index file tracks entry sizes and
+    last use; least recently used entries are evicted once the cache exceeds
+    max_bytes. Attachments that produced no text are cached too.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.spool_dir = os.path.join(directory, "spool")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._remove_stale_spool_files()
+        self.entries = self._load_index()
+        self._total_bytes = sum(entry["size"] for entry in self.entries.values())
+
+    @staticmethod
+    def _key(attachment_id, version):
+        return f"{attachment_id}-v{version}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.jsonl")
+
+    def _remove_stale_spool_files(self, max_age=24 * 3600):
+        """Delete spool files left behind by runs that crashed"""
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _load_index(self):
+        path = os.path.join(self.directory, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable attachment cache index: {e}")
+            return {}
+        # Drop entries whose files have gone missing
+        return {
+            key: entry for key, entry in entries.items()
+            if entry["segment_count"] == 0 or os.path.exists(self._path(key))
+        }
+
+    def save(self):
+        """Atomically write the index to disk"""
+        with self._lock:
+            path = os.path.join(self.directory, self.INDEX_FILE)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, path)
+
+    @staticmethod
+    def _link_or_copy(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def get(self, attachment_id, version):
+        """
+        Look up extracted text. Returns (found, ExtractedText or None).
+        A hit with no text means the attachment was parsed before and was empty.
+        The returned ExtractedText is a private link to the cached file, so the
+        caller may discard it and eviction never pulls a file from under a reader.
+        """
+        if version is None:
+            return False, None
+        key = self._key(attachment_id, version)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            entry["last_used"] = time.time()
+            self.hits += 1
+            if entry["segment_count"] == 0:
+                return True, None
+
+            fd, link_path = tempfile.mkstemp(prefix="cached-", suffix=".jsonl", dir=self.spool_dir)
+            os.close(fd)
+            os.remove(link_path)
+            try:
+                self._link_or_copy(self._path(key), link_path)
+            except OSError as e:
+                logger.warning(f"Cached text for {key} is unreadable, dropping it: {e}")
+                self._total_bytes -= entry["size"]
+                del self.entries[key]
+                self.hits -= 1
+                self.misses += 1
+                return False, None
+            return True, ExtractedText(link_path, entry["char_count"], entry["segment_count"])
+
+    def put(self, attachment_id, version, extracted):
+        """Store extracted text (or the fact that it was empty) for this attachment version"""
+        if version is None:
+            return
+        key = self._key(attachment_id, version)
+        has_text = extracted is not None and extracted.segment_count > 0
+        size = 0
+        if has_text:
+            self._link_or_copy(extracted.path, self._path(key) + ".tmp")
+            os.replace(self._path(key) + ".tmp", self._path(key))
+            size = os.path.getsize(self._path(key))
+
+        with self._lock:
+            # Older versions of this attachment will never be asked for again
+            prefix = f"{attachment_id}-v"
+            for old_key in [k for k in self.entries if k.startswith(prefix) and k != key]:
+                self._remove_locked(old_key)
+            if key in self.entries:
+                self._total_bytes -= self.entries[key]["size"]
+
+            self.entries[key] = {
+                "size": size,
+                "char_count": extracted.char_count if has_text else 0,
+                "segment_count": extracted.segment_count if has_text else 0,
+                "last_used": time.time()
+            }
+            self._total_bytes += size
+            self._evict_locked()
+        self.save()
+
+    def _remove_locked(self, key):
+        entry = self.entries.pop(key)
+        self._total_bytes -= entry["size"]
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict_locked(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if self._total_bytes <= target:
+                break
+            self._remove_locked(key)
+            self.evictions += 1
+        logger.info(f"Attachment cache evicted down to {self._total_bytes} bytes")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
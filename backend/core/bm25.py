@@ -0,0 +1,171 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from core.config import BM25_INDEX_PATH
+from core.logger import setup_logger
+
+logger = setup_logger('bm25')
+
+# Words plus identifiers such as error codes, SKUs and Jira keys (ERR-1042, PROJ-123, v2.3.1)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[-_./:][a-z0-9]+)*')
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+me my no not of on or our so than that the their then there these they this to was we
+what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercased terms of a text. A compound identifier is kept whole and also
+    split into its parts, so "ERR-1042" matches queries for "err-1042" and "1042".
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        parts = re.split(r'[-_./:]', token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    On-disk inverted index over chunk text, scored with Okapi BM25.
+
+    Postings (term, document, term frequency) live in an SQLite table
+    clustered by term, so a query reads only the posting lists of its
+    terms. Documents are keyed by their vector id and can be replaced or
+    deleted individually, which keeps the index in step with incremental
+    ingestion.
+    """
+
+    def __init__(self, path=BM25_INDEX_PATH, k1=1.2, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                doc INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                length INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc)")
+        self._conn.commit()
+
+    def _delete_locked(self, ids):
+        for vector_id in ids:
+            row = self._conn.execute("SELECT doc FROM documents WHERE id = ?", (vector_id,)).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM postings WHERE doc = ?", row)
+                self._conn.execute("DELETE FROM documents WHERE doc = ?", row)
+
+    def add(self, documents):
+        """Index (id, text) pairs, replacing any earlier version of the same ids"""
+        documents = list(documents)
+        if not documents:
+            return
+        with self._lock:
+            self._delete_locked(vector_id for vector_id, _ in documents)
+            for vector_id, text in documents:
+                counts = Counter(tokenize(text))
+                cursor = self._conn.execute(
+                    "INSERT INTO documents (id, length) VALUES (?, ?)",
+                    (vector_id, sum(counts.values()))
+                )
+                doc = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                    [(term, doc, tf) for term, tf in counts.items()]
+                )
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+
+    def search(self, query, top_k=10):
+        """Best matching (id, score) pairs for a query, highest score first"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+            ).fetchone()
+            if not doc_count:
+                return []
+            avg_length = total_length / doc_count
+
+            scores = Counter()
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.doc, p.tf, d.length FROM postings p JOIN documents d ON d.doc = p.doc WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = scores.most_common(top_k)
+            if not best:
+                return []
+            placeholders = ",".join("?" * len(best))
+            ids = dict(self._conn.execute(
+                f"SELECT doc, id FROM documents WHERE doc IN ({placeholders})", [doc for doc, _ in best]
+            ).fetchall())
+        return [(ids[doc], score) for doc, score in best]
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {"documents": documents, "terms": terms}
+
+
+# Shared by the ingestion pipeline and the query path
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_bm25_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BM25Index()
+        return _index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it
+    appears in (rank starting at 1). Returns (id, fused score) best first.
+    """
+    fused = Counter()
+    for ranking in rankings:
+        for rank, vector_id in enumerate(ranking, start=1):
+            fused[vector_id] += 1 / (k + rank)
+    return fused.most_common()
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional per-entry TTL (seconds).
+    Expired entries are dropped when they are looked up or reach the LRU end.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
@@ -0,0 +1,144 @@
+import re
+
+# Sentence ends (., ! or ? followed by whitespace) and line breaks
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class CharChunker:
+    """
+    Fixed-size character windows with overlap. Used when the embedding model
+    has no tokenizer (the TF-IDF fallback).
+    """
+
+    def __init__(self, chunk_size=1000, overlap=100):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.fingerprint = f"chars-{chunk_size}-{overlap}"
+
+    def chunk(self, segments):
+        """
+        Split a stream of (text, metadata) segments into overlapping character windows.
+        Yields (chunk, metadata) where metadata is that of the segment the chunk starts in.
+        Only the not yet chunked tail of the stream is buffered, never the whole document.
+        """
+        chunk_size = self.chunk_size
+        overlap = self.overlap
+        step = chunk_size - overlap
+        buffer = ""
+        marks = []  # (offset in buffer, metadata) where each buffered segment starts
+        emitted = False
+
+        def meta_at(offset):
+            current = {}
+            for start, meta in marks:
+                if start > offset:
+                    break
+                current = meta
+            return current
+
+        for text, meta in segments:
+            if not text:
+                continue
+            marks.append((len(buffer), meta))
+            buffer += text
+
+            pos = 0
+            while len(buffer) - pos >= chunk_size:
+                yield buffer[pos:pos+chunk_size], meta_at(pos)
+                emitted = True
+                pos += step
+            if pos:
+                # Drop consumed text, keeping the segment mark that covers the new start
+                covering = meta_at(pos)
+                buffer = buffer[pos:]
+                marks = [(0, covering)] + [(start - pos, m) for start, m in marks if start > pos]
+
+        # The first `overlap` chars of the tail were already sent with the previous chunk
+        if buffer and (not emitted or len(buffer) > overlap):
+            yield buffer, meta_at(0)
+
+    def count_truncated(self, chunks):
+        """Without a tokenizer truncation can't be measured"""
+        return None
+
+
+class TokenChunker:
+    """
+    Packs whole sentences into chunks of at most max_tokens word-pieces, so
+    every chunk fits the embedding model's input window and the stored text is
+    exactly the text that was embedded. Sentences are tokenized in batches with
+    the model's own tokenizer; a single sentence longer than the window is cut
+    at token boundaries.
+    """
+
+    def __init__(self, tokenizer, max_tokens, model_max_tokens=None, batch_size=256):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        # Window of the model including its special tokens, used to measure truncation
+        self.model_max_tokens = model_max_tokens or max_tokens + 2
+        self.batch_size = batch_size
+        # Chunks never overlap
+        self.overlap = 0
+        self.fingerprint = f"tokens-{max_tokens}"
+
+    def _token_counts(self, texts):
+        encoded = self.tokenizer(texts, add_special_tokens=False, truncation=False, verbose=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _split_long_sentence(self, sentence):
+        """Cut a sentence that alone exceeds the window into token-bounded pieces of the original text"""
+        encoded = self.tokenizer(
+            sentence, add_special_tokens=False, truncation=False,
+            return_offsets_mapping=True, verbose=False
+        )
+        offsets = encoded["offset_mapping"]
+        for start in range(0, len(offsets), self.max_tokens):
+            window = offsets[start:start+self.max_tokens]
+            piece = sentence[window[0][0]:window[-1][1]].strip()
+            if piece:
+                yield piece
+
+    def chunk(self, segments):
+        """
+        Yield (chunk, metadata) for a stream of (text, metadata) segments.
+        Chunks only break between sentences (or inside a sentence longer than
+        the window); metadata is that of the chunk's first sentence.
+        """
+        current = []
+        current_tokens = 0
+        current_meta = {}
+
+        for text, meta in segments:
+            sentences = split_sentences(text)
+            for start in range(0, len(sentences), self.batch_size):
+                batch = sentences[start:start+self.batch_size]
+                for sentence, tokens in zip(batch, self._token_counts(batch)):
+                    if tokens > self.max_tokens:
+                        if current:
+                            yield " ".join(current), current_meta
+                            current, current_tokens = [], 0
+                        for piece in self._split_long_sentence(sentence):
+                            yield piece, meta
+                        continue
+
+                    if current and current_tokens + tokens > self.max_tokens:
+                        yield " ".join(current), current_meta
+                        current, current_tokens = [], 0
+                    if not current:
+                        current_meta = meta
+                    current.append(sentence)
+                    current_tokens += tokens
+
+        if current:
+            yield " ".join(current), current_meta
+
+    def count_truncated(self, chunks):
+        """Number of chunks the model would truncate (longer than its window incl. special tokens)"""
+        if not chunks:
+            return 0
+        counts = self._token_counts(chunks)
+        return sum(1 for count in counts if count + 2 > self.model_max_tokens)
@@ -19,6 +19,55 @@ _page_ids_str = os.getenv("PAGE_IDS", "")
 # Split by comma, space, dot, or pipe to handle various copy-paste formats like "id1. id2" or "id1 id2"
 PAGE_IDS = [pid.strip() for pid in re.split(r'[,\s.|]+', _page_ids_str) if pid.strip()]
 
+# Crawler mode: ingest whole spaces and/or a CQL query instead of PAGE_IDS
+_space_keys_str = os.getenv("CONFLUENCE_SPACE_KEYS", "")
+CONFLUENCE_SPACE_KEYS = [key.strip() for key in re.split(r'[,\s|]+', _space_keys_str) if key.strip()]
+CONFLUENCE_CQL = os.getenv("CONFLUENCE_CQL", "").strip()
+CRAWL_PAGE_SIZE = int(os.getenv("CRAWL_PAGE_SIZE", "100"))  # Results per search call (server may cap it)
+
+# Confluence fetch concurrency (ingestion)
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))  # Pages fetched in parallel
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "4"))  # Max in-flight requests per host
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "5"))  # Retries on 429/5xx/connection errors
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))  # Seconds per HTTP request
+
+# Attachment text extraction (process pool)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 2)))  # Parser processes
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "120"))  # Seconds of parse time per attachment
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_MB", "50")) * 1024 * 1024  # Larger files are skipped
+
+# Incremental ingestion state (page versions already in the index)
+INGEST_STATE_DIR = os.getenv("INGEST_STATE_DIR", "./ingest_state")
+INGEST_MANIFEST_PATH = os.path.join(INGEST_STATE_DIR, "manifest.json")
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", os.path.join(INGEST_STATE_DIR, "attachment_text"))
+ATTACHMENT_CACHE_MAX_MB = int(os.getenv("ATTACHMENT_CACHE_MAX_MB", "1024"))  # Extracted text kept across runs
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))  # Max items buffered between pipeline stages
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))  # Chunks per embed/upsert batch
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))  # 0 = fill the embedding model's window
+
+# Persistent embedding cache for ingestion (keyed by model id + sha256 of chunk text)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(INGEST_STATE_DIR, "embeddings.sqlite"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# Hybrid retrieval: BM25 over chunk text (built at ingest time) fused with vector search
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(INGEST_STATE_DIR, "bm25.sqlite"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # Candidates taken from each retriever before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))  # Reciprocal-rank fusion constant
+
+# Startup
+FAST_START = os.getenv("FAST_START", "false").lower() == "true"  # Accept requests while services load
+STARTUP_INGESTION = os.getenv("STARTUP_INGESTION", "blocking").lower()  # blocking, background or skip
+
+# Vector store: pinecone, or local (memory-mapped vectors on disk, works offline)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+VECTOR_DIMENSION = int(os.getenv("VECTOR_DIMENSION", "384"))  # all-MiniLM-L6-v2
+LOCAL_VECTOR_STORE_DIR = os.getenv("LOCAL_VECTOR_STORE_DIR", "./vector_store")
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")  # float32 or float16
+IVF_MIN_VECTORS = int(os.getenv("IVF_MIN_VECTORS", "4096"))  # Smaller namespaces are searched exactly
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))  # IVF lists scanned per query
+
 # Pinecone
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = os.getenv("INDEX_NAME", "agentic-hackathon-index")
@@ -34,6 +83,53 @@ AZURE_MODEL_NAME = os.getenv("AZURE_MODEL_NAME", "gpt-4o-mini")
 
 # Embedding Model
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")  # Local model directory; nothing is downloaded when set
+EMBEDDING_OFFLINE = os.getenv("EMBEDDING_OFFLINE", "false").lower() == "true"  # Only use models already in models_cache
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()  # torch or onnx
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_int8.onnx")  # Relative to the model directory
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))  # 0 = onnxruntime default
+
+# Query embedding micro-batching (chat path)
+EMBED_BATCHING_ENABLED = os.getenv("EMBED_BATCHING_ENABLED", "true").lower() == "true"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))  # Queries per model call
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))  # How long the first query waits for company
+
+# Optional cross-encoder rerank of retrieved chunks before they go into the prompt
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MODEL_PATH = os.getenv("RERANK_MODEL_PATH", "")  # Local model directory; nothing is downloaded when set
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))  # Chunks kept after reranking
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))  # Past this, keep the retrieval order
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # Tokens of query + chunk scored
+
+# Azure agent runs: status polls start fast and back off while a run takes longer
+AZURE_POLL_INITIAL_MS = float(os.getenv("AZURE_POLL_INITIAL_MS", "100"))
+AZURE_POLL_MAX_MS = float(os.getenv("AZURE_POLL_MAX_MS", "1000"))
+AZURE_POLL_BACKOFF = float(os.getenv("AZURE_POLL_BACKOFF", "1.5"))
+AZURE_MAX_CONCURRENT_RUNS = int(os.getenv("AZURE_MAX_CONCURRENT_RUNS", "64"))  # Per worker process
+TITLE_TIMEOUT_SECONDS = float(os.getenv("TITLE_TIMEOUT_SECONDS", "30"))
+TITLE_MAX_CONCURRENT = int(os.getenv("TITLE_MAX_CONCURRENT", "4"))  # Background title generations at once
+TITLE_MAX_PENDING = int(os.getenv("TITLE_MAX_PENDING", "200"))  # Past this, new conversations keep their extractive title
+
+# Context packing: how retrieved chunks are turned into the prompt's context
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))  # Token budget for all context blocks
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1 = relevance only, 0 = diversity only
+CONTEXT_SCORE_CLIFF = float(os.getenv("CONTEXT_SCORE_CLIFF", "0.15"))  # Cosine drop that cuts off the weaker matches
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.9"))  # Term overlap treated as duplicate
+
+# Query-path caches (query text -> vector, vector -> matches)
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "4096"))
+QUERY_VECTOR_CACHE_TTL = float(os.getenv("QUERY_VECTOR_CACHE_TTL", "86400"))  # Seconds; vectors only change with the model
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))  # Seconds; bounds staleness from writers in other processes
+
+# Semantic answer cache for first-turn questions
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # Min cosine similarity of the questions
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # Seconds per entry
 
 # Jira Configuration
 JIRA_BASE_URL = os.getenv("JIRA_BASE_URL")
@@ -0,0 +1,222 @@
+import itertools
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from core.config import (
+    DOMAIN, EMAIL, API_TOKEN,
+    FETCH_CONCURRENCY, FETCH_PER_HOST_LIMIT, FETCH_MAX_RETRIES, FETCH_TIMEOUT
+)
+from core.logger import setup_logger
+
+logger = setup_logger('confluence_client')
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_END = object()
+
+
+class ConfluenceClient:
+    """
+    Concurrent HTTP client for the Confluence REST API.
+
+    - Bounded worker pool for fetching many pages at once
+    - One pooled keep-alive session per worker thread
+    - Per-host concurrency limit shared by all workers
+    - Retries on 429/5xx, honouring Retry-After and pausing the whole host
+    """
+
+    def __init__(self, max_workers=FETCH_CONCURRENCY, per_host_limit=FETCH_PER_HOST_LIMIT,
+                 max_retries=FETCH_MAX_RETRIES, timeout=FETCH_TIMEOUT):
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.auth = HTTPBasicAuth(EMAIL, API_TOKEN)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+        self._host_paused_until = {}
+
+    def _session(self):
+        """Return the keep-alive session owned by the calling thread"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.auth = self.auth
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.per_host_limit)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+        return session
+
+    def _host_semaphore(self, host):
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_semaphores[host]
+
+    def _wait_for_host(self, host):
+        """Block while the host is cooling down after a 429"""
+        with self._lock:
+            paused_until = self._host_paused_until.get(host, 0)
+        delay = paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pause_host(self, host, delay):
+        with self._lock:
+            until = time.monotonic() + delay
+            if until > self._host_paused_until.get(host, 0):
+                self._host_paused_until[host] = until
+
+    @staticmethod
+    def _retry_after(response, attempt):
+        """Seconds to wait before retrying, from Retry-After or exponential backoff"""
+        header = response.headers.get("Retry-After") if response is not None else None
+        if header:
+            try:
+                return max(0.0, float(header))
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(header)
+                    return max(0.0, retry_at.timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return min(60.0, 2 ** attempt)
+
+    def get(self, url, **kwargs):
+        """
+        GET a URL with per-host limiting and retries.
+        Returns the final response (which may still be an error status).
+        """
+        host = urlparse(url).netloc
+        semaphore = self._host_semaphore(host)
+        kwargs.setdefault("timeout", self.timeout)
+        response = None
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_host(host)
+            try:
+                with semaphore:
+                    response = self._session().get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(60.0, 2 ** attempt)
+                logger.warning(f"Request to {host} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                return response
+
+            delay = self._retry_after(response, attempt)
+            logger.warning(
+                f"{host} returned {response.status_code}, retrying in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{self.max_retries})"
+            )
+            if response.status_code == 429:
+                # Rate limited: hold back every worker talking to this host
+                self._pause_host(host, delay)
+            else:
+                time.sleep(delay)
+            response.close()
+
+        return response
+
+    def get_json(self, url, **kwargs):
+        """GET a JSON resource. Returns (status_code, parsed body or None)."""
+        headers = kwargs.pop("headers", {})
+        headers.setdefault("Accept", "application/json")
+        response = self.get(url, headers=headers, **kwargs)
+        if response.status_code != 200:
+            return response.status_code, None
+        return response.status_code, response.json()
+
+    def search(self, cql, limit=100, expand="body.storage,version"):
+        """
+        Page through /wiki/rest/api/content/search for a CQL query.
+        Yields each page of results (a list of content dicts) as soon as it arrives.
+        Raises RuntimeError if a page of results cannot be fetched.
+        """
+        url = f"https://{DOMAIN}/wiki/rest/api/content/search"
+        params = {"cql": cql, "limit": limit, "expand": expand}
+        while url:
+            status_code, data = self.get_json(url, params=params)
+            if status_code != 200:
+                raise RuntimeError(f"CQL search failed with status {status_code}: {cql}")
+            yield data.get("results", [])
+
+            # The next link already carries the cursor and the original parameters
+            links = data.get("_links", {})
+            next_link = links.get("next")
+            url = f"{links.get('base', f'https://{DOMAIN}/wiki')}{next_link}" if next_link else None
+            params = None
+
+    def download(self, url, directory=None, max_bytes=None):
+        """
+        Stream a file to a temp file on disk instead of holding it in memory.
+        Returns (status_code, path); path is None on error or if the file exceeds max_bytes.
+        The caller owns the file and must delete it.
+        """
+        response = self.get(url, stream=True)
+        try:
+            if response.status_code != 200:
+                return response.status_code, None
+            fd, path = tempfile.mkstemp(prefix="download-", dir=directory)
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for block in response.iter_content(chunk_size=64 * 1024):
+                    size += len(block)
+                    if max_bytes and size > max_bytes:
+                        break
+                    f.write(block)
+            if max_bytes and size > max_bytes:
+                logger.warning(f"Download of {url} exceeds {max_bytes} bytes, discarding")
+                os.remove(path)
+                return response.status_code, None
+            return response.status_code, path
+        finally:
+            response.close()
+
+    def map(self, fn, items, window=None):
+        """
+        Run fn over items on the bounded worker pool.
+        At most `window` tasks are in flight, so results are never produced much
+        faster than the caller consumes them. Items may be any iterable, including
+        a generator that is still being filled.
+        Yields (item, result) pairs as they complete; failures yield (item, None).
+        """
+        window = window or self.max_workers * 2
+        pending_items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="confluence-fetch") as executor:
+            futures = {}
+            for item in itertools.islice(pending_items, window):
+                futures[executor.submit(fn, item)] = item
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Fetch task for {item} failed: {e}", exc_info=True)
+                        result = None
+                    yield item, result
+
+                    # Refill the window as results are consumed
+                    next_item = next(pending_items, _END)
+                    if next_item is not _END:
+                        futures[executor.submit(fn, next_item)] = next_item
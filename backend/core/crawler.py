@@ -0,0 +1,106 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import CONFLUENCE_SPACE_KEYS, CONFLUENCE_CQL, CRAWL_PAGE_SIZE
+from core.logger import setup_logger
+
+logger = setup_logger('crawler')
+
+# Search results carry the page body, version and first attachments, so
+# discovered pages need no further per-page fetch round trip
+CRAWL_EXPAND = "body.storage,version,children.attachment.version"
+
+_DONE = object()
+
+
+def build_crawl_queries(space_keys=CONFLUENCE_SPACE_KEYS, cql=CONFLUENCE_CQL):
+    """One CQL query per space (so spaces are paged in parallel), plus the custom query if set"""
+    queries = [f'space = "{key}" and type = page' for key in space_keys]
+    if cql:
+        queries.append(cql)
+    return queries
+
+
+class ConfluenceCrawler:
+    """
+    Discovers pages through CQL search and streams them to the ingestion stages.
+
+    Each query is paged through on its own thread with large `limit` values and
+    bodies expanded inline. Pages are yielded as they arrive, de-duplicated
+    across queries.
+    """
+
+    def __init__(self, client, page_size=CRAWL_PAGE_SIZE):
+        self.client = client
+        self.page_size = page_size
+        self.complete = False
+        self.pages_discovered = 0
+
+    def _run_query(self, cql, results, stop):
+        try:
+            for batch in self.client.search(cql, limit=self.page_size, expand=CRAWL_EXPAND):
+                logger.info(f"CQL '{cql}': received {len(batch)} pages")
+                for page in batch:
+                    while not stop.is_set():
+                        try:
+                            results.put(page, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return False
+            return True
+        except Exception as e:
+            logger.error(f"Crawl of '{cql}' failed: {e}", exc_info=True)
+            return False
+        finally:
+            while True:
+                try:
+                    results.put(_DONE, timeout=0.5)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        break
+
+    def crawl(self, queries):
+        """
+        Yield page content dicts for all queries.
+        `complete` is True afterwards only if every query was paged to the end,
+        which is what makes it safe to treat unseen pages as deleted.
+        """
+        self.complete = False
+        self.pages_discovered = 0
+        if not queries:
+            return
+
+        results = queue.Queue(maxsize=self.page_size * 2)
+        stop = threading.Event()
+        seen = set()
+        workers = min(len(queries), self.client.max_workers)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="confluence-crawl")
+        futures = [executor.submit(self._run_query, cql, results, stop) for cql in queries]
+
+        try:
+            remaining = len(queries)
+            while remaining:
+                page = results.get()
+                if page is _DONE:
+                    remaining -= 1
+                    continue
+                if page["id"] in seen:
+                    continue
+                seen.add(page["id"])
+                self.pages_discovered += 1
+                yield page
+            self.complete = all(future.result() for future in futures)
+            logger.info(f"Crawl finished: {self.pages_discovered} pages, complete={self.complete}")
+        finally:
+            stop.set()
+            # Unblock producers still waiting on a full queue
+            while True:
+                try:
+                    results.get_nowait()
+                except queue.Empty:
+                    break
+            executor.shutdown(wait=False)
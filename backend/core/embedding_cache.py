@@ -0,0 +1,166 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from core.logger import setup_logger
+
+logger = setup_logger('embedding_cache')
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of embedding vectors.
+
+    Vectors are stored as float32 blobs in SQLite, keyed by (model id, sha256 of
+    the chunk text). Least recently used rows are evicted once the stored vectors
+    exceed max_bytes.
+    """
+
+    def __init__(self, path, model_id, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.model_id = model_id
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model_id, text_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts):
+        """Return a list with a float32 vector for each cached text and None for misses"""
+        hashes = [self.text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look up in slices
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i+500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    [self.model_id, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model_id = ? AND text_hash = ?",
+                    [(now, self.model_id, h) for h in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((self.model_id, self.text_hash(text), len(vector), blob, len(blob), now))
+
+        with self._lock:
+            for row in rows:
+                previous = self._conn.execute(
+                    "SELECT size FROM embeddings WHERE model_id = ? AND text_hash = ?",
+                    (row[0], row[1])
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model_id, text_hash, dim, vector, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    row
+                )
+                self._total_bytes += row[4] - (previous[0] if previous else 0)
+            self._conn.commit()
+            self._evict_locked()
+
+    def _evict_locked(self):
+        """Drop least recently used vectors until the cache is back under 90% of max_bytes"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT model_id, text_hash, size FROM embeddings ORDER BY last_used ASC LIMIT 500"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for model_id, text_hash, size in rows:
+                if self._total_bytes <= target:
+                    break
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE model_id = ? AND text_hash = ?",
+                    (model_id, text_hash)
+                )
+                self._total_bytes -= size
+                evicted += 1
+        self._conn.commit()
+        self.evictions += evicted
+        logger.info(f"Evicted {evicted} embeddings, cache size now {self._total_bytes} bytes")
+
+    def encode(self, model, texts):
+        """
+        Encode texts with the model, reusing cached vectors.
+        Only cache misses are sent to the model, in a single batch.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors = self.get_many(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # Identical texts within a batch only need to be encoded once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = np.asarray(model.encode(unique_texts), dtype=np.float32)
+            self.put_many(unique_texts, encoded)
+            by_text = dict(zip(unique_texts, encoded))
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        return np.vstack(vectors)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
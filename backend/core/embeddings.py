@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from core.config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_PATH, EMBEDDING_OFFLINE,
+    EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, EMBEDDING_ONNX_THREADS
+)
+from core.logger import setup_logger
+
+logger = setup_logger('embeddings')
+
+MODELS_CACHE_DIR = "./models_cache"
+
+# Process-wide registry: one loaded model per (repo id, backend), shared by every caller
+_models = {}
+_registry_lock = threading.Lock()
+_load_locks = {}
+
+
+def model_repo_id(name=EMBEDDING_MODEL_NAME):
+    """Hugging Face repo id for a model name; bare names are sentence-transformers models"""
+    return name if "/" in name else f"sentence-transformers/{name}"
+
+
+def resolve_model_dir(repo_id, model_path=EMBEDDING_MODEL_PATH, offline=EMBEDDING_OFFLINE):
+    """
+    Local directory holding the model files. `model_path` (EMBEDDING_MODEL_PATH
+    by default) is used as is; otherwise the snapshot in models_cache,
+    downloaded first unless offline.
+    """
+    if model_path:
+        if not os.path.isdir(model_path):
+            raise FileNotFoundError(f"Model path does not exist: {model_path}")
+        return model_path
+
+    from huggingface_hub import snapshot_download
+    os.makedirs(MODELS_CACHE_DIR, exist_ok=True)
+    model_path = snapshot_download(
+        repo_id=repo_id,
+        cache_dir=MODELS_CACHE_DIR,
+        local_files_only=offline
+    )
+    print(f"Model downloaded to: {model_path}")
+    return model_path
+
+
+def _read_json(model_dir, name, default):
+    path = os.path.join(model_dir, name)
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class OnnxEmbedder:
+    """
+    Runs a sentence-transformers model exported to ONNX (see scripts/export_onnx.py)
+    on onnxruntime's CPU provider. Reproduces the sentence-transformers head:
+    mean pooling over the attention mask, then L2 normalization if the model
+    has a Normalize module. encode() follows SentenceTransformer.encode: a
+    string gives one vector, a list gives a 2-D array.
+    """
+
+    def __init__(self, model_dir, onnx_path, threads=0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        # Fast tokenizers can't be called from several threads at once
+        self._tokenizer_lock = threading.Lock()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        config = _read_json(model_dir, "sentence_bert_config.json", {})
+        self.max_seq_length = config.get("max_seq_length") or self.tokenizer.model_max_length
+        modules = _read_json(model_dir, "modules.json", [])
+        self.normalize = any(module.get("type", "").endswith("Normalize") for module in modules)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            batch = list(sentences[start:start+batch_size])
+            with self._tokenizer_lock:
+                encoded = self.tokenizer(
+                    batch, padding=True, truncation=True,
+                    max_length=self.max_seq_length, return_tensors="np"
+                )
+            feed = {}
+            for name in self.input_names:
+                if name in encoded:
+                    feed[name] = encoded[name].astype(np.int64)
+                elif name == "token_type_ids":
+                    feed[name] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+            token_embeddings = self.session.run(None, feed)[0]
+
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        vectors = np.vstack(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def __call__(self, sentences):
+        return self.encode(sentences)
+
+
+def _load_model(repo_id, backend):
+    model_dir = resolve_model_dir(repo_id)
+
+    if backend == "onnx":
+        onnx_path = os.path.join(model_dir, EMBEDDING_ONNX_FILE)
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"No ONNX model at {onnx_path}; create it with scripts/export_onnx.py"
+            )
+        model = OnnxEmbedder(model_dir, onnx_path, threads=EMBEDDING_ONNX_THREADS)
+        # Quantized vectors differ slightly, so they must not share cached vectors or manifests
+        model.registry_id = f"{repo_id}|onnx:{EMBEDDING_ONNX_FILE}"
+        logger.info(f"ONNX embedding model loaded from: {onnx_path}")
+        return model
+
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    from sentence_transformers import SentenceTransformer
+    # Now load the model from the local path
+    model = SentenceTransformer(model_dir)
+    model.registry_id = repo_id
+    logger.info(f"Embedding model loaded successfully from: {model_dir}")
+    return model
+
+
+def lowercases_input(model):
+    """True only if the model's tokenizer reports lowercasing its input (uncased models)"""
+    tokenizer = getattr(model, "tokenizer", None)
+    return getattr(tokenizer, "do_lower_case", False) is True
+
+
+def get_embedding_model(name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """
+    Return the shared embedding model, loading it on first use.
+    Concurrent first calls wait for a single load instead of each loading a copy.
+    Raises if the model can't be loaded; the next call tries again.
+    The returned model carries `registry_id`, which identifies the vectors it produces.
+    """
+    key = (model_repo_id(name), backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    with load_lock:
+        if key not in _models:
+            print(f"Loading embedding model {key[0]} ({backend})...")
+            _models[key] = _load_model(*key)
+        return _models[key]
@@ -0,0 +1,221 @@
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from bs4 import BeautifulSoup
+from pypdf import PdfReader
+from docx import Document
+
+from core.config import EXTRACT_WORKERS, EXTRACT_TIMEOUT, ATTACHMENT_MAX_BYTES
+
+# Attachment media types we know how to turn into text
+PDF_TYPES = ('application/pdf',)
+DOCX_TYPES = ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/msword')
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+
+
+def clean_html(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text(separator=' ')
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    return text
+
+
+def _open_source(source):
+    """Attachments arrive either as raw bytes or as the path of a downloaded file"""
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def iter_pdf_segments(source):
+    """Yield (page_number, text) for each PDF page, one page at a time"""
+    reader = PdfReader(_open_source(source))
+    for page_number, page in enumerate(reader.pages, start=1):
+        yield page_number, (page.extract_text() or "") + "\n"
+
+
+def iter_docx_segments(source):
+    """Yield (None, text) per paragraph and per table row; DOCX has no fixed pages"""
+    doc = Document(_open_source(source))
+    for paragraph in doc.paragraphs:
+        yield None, paragraph.text + "\n"
+    # Also extract text from tables
+    for table in doc.tables:
+        for row in table.rows:
+            yield None, "".join(cell.text + " " for cell in row.cells) + "\n"
+
+
+def iter_html_segments(source):
+    if not isinstance(source, bytes):
+        with open(source, "rb") as f:
+            source = f.read()
+    html_content = source.decode('utf-8', errors='ignore')
+    yield None, clean_html(html_content)
+
+
+def is_supported(media_type):
+    return media_type in PDF_TYPES or media_type in DOCX_TYPES or media_type in HTML_TYPES
+
+
+def extract_to_file(media_type, source, out_path):
+    """
+    Extract text from an attachment into a JSON-lines file, one segment per line.
+    Runs inside a worker process. Returns (char_count, segment_count, error) so
+    failures never raise across the process boundary.
+    """
+    if media_type in PDF_TYPES:
+        segments = iter_pdf_segments(source)
+    elif media_type in DOCX_TYPES:
+        segments = iter_docx_segments(source)
+    elif media_type in HTML_TYPES:
+        segments = iter_html_segments(source)
+    else:
+        return 0, 0, f"Unsupported file type: {media_type}"
+
+    char_count = 0
+    segment_count = 0
+    try:
+        with open(out_path, "w", encoding="utf-8") as f:
+            for page_number, text in segments:
+                if not text.strip():
+                    continue
+                f.write(json.dumps({"page": page_number, "text": text}) + "\n")
+                char_count += len(text)
+                segment_count += 1
+        return char_count, segment_count, None
+    except Exception as e:
+        return char_count, segment_count, f"{type(e).__name__}: {e}"
+
+
+class ExtractedText:
+    """
+    Attachment text spooled to disk by an extractor worker.
+    Segments are read back lazily, so only one page is held in memory at a time.
+    """
+
+    def __init__(self, path, char_count, segment_count):
+        self.path = path
+        self.char_count = char_count
+        self.segment_count = segment_count
+
+    def segments(self):
+        """Yield (text, page_number) pairs in document order"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                yield record["text"], record.get("page")
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AttachmentExtractor:
+    """
+    Runs attachment parsing in a process pool so CPU-bound parsers don't hold
+    the ingesting process's GIL.
+
+    - Files over max_bytes are skipped before they are sent to a worker
+    - Each file gets `timeout` seconds of worker time; a file that overruns or
+      crashes its worker takes the pool down with it and the pool is rebuilt,
+      so one poisoned document can't stall the rest of the ingestion
+    """
+
+    def __init__(self, max_workers=EXTRACT_WORKERS, timeout=EXTRACT_TIMEOUT, max_bytes=ATTACHMENT_MAX_BYTES,
+                 spool_dir=None):
+        self.max_workers = max(1, max_workers)
+        self.spool_dir = spool_dir
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pool = None
+        self._generation = 0
+        # Only submit when a worker is free, so the timeout measures parse time, not queueing
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs fetch threads is not safe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._generation += 1
+            return self._pool, self._generation
+
+    def _reset_pool(self, generation):
+        """Kill the workers of the given pool generation; the next call starts a fresh pool"""
+        with self._lock:
+            if self._pool is None or generation != self._generation:
+                return
+            pool = self._pool
+            self._pool = None
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, media_type, source, filename=""):
+        """
+        Extract text from an attachment, given as bytes or as a file path.
+        Passing a path keeps the file out of this process's memory entirely.
+        Returns an ExtractedText (segment_count is 0 for a file with no text),
+        or None when the file was skipped or could not be parsed.
+        """
+        if not is_supported(media_type):
+            print(f"   Unsupported file type: {media_type}")
+            return None
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        if size > self.max_bytes:
+            print(f"   Skipping {filename}: {size} bytes exceeds limit of {self.max_bytes}")
+            return None
+
+        fd, out_path = tempfile.mkstemp(prefix="extract-", suffix=".jsonl", dir=self.spool_dir)
+        os.close(fd)
+        result = self._run(media_type, source, out_path, filename)
+        if result is None:
+            os.remove(out_path)
+            return None
+        char_count, segment_count = result
+        return ExtractedText(out_path, char_count, segment_count)
+
+    def _run(self, media_type, source, out_path, filename):
+        """Run extract_to_file in the pool. Returns (char_count, segment_count) or None."""
+        # One retry covers a pool that was torn down by some other attachment
+        for attempt in range(2):
+            with self._slots:
+                pool, generation = self._get_pool()
+                try:
+                    future = pool.submit(extract_to_file, media_type, source, out_path)
+                    char_count, segment_count, error = future.result(timeout=self.timeout)
+                except FuturesTimeoutError:
+                    print(f"   Extraction of {filename} timed out after {self.timeout}s, restarting extractor pool")
+                    self._reset_pool(generation)
+                    return None
+                except BrokenProcessPool:
+                    print(f"   Extractor pool broke while parsing {filename} (attempt {attempt + 1}/2)")
+                    self._reset_pool(generation)
+                    continue
+
+            if error:
+                print(f"   Error reading {filename}: {error}")
+                return None
+            return char_count, segment_count
+        return None
+
+    def shutdown(self):
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
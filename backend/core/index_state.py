@@ -0,0 +1,17 @@
+import threading
+
+# Incremented whenever this process changes the contents of the vector index,
+# so cached retrieval results from before the change are never served again
+_generation = 0
+_lock = threading.Lock()
+
+
+def index_generation():
+    return _generation
+
+
+def bump_index_generation():
+    global _generation
+    with _lock:
+        _generation += 1
+        return _generation
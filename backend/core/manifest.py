@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from core.logger import setup_logger
+
+logger = setup_logger('manifest')
+
+
+class IngestionManifest:
+    """
+    Local record of what has been ingested for each Confluence page.
+
+    Maps page_id -> {"version", "fingerprint", "source", "chunk_count", "ingested_at"}
+    and is persisted as JSON so restarts only re-ingest pages whose version changed.
+    The version is the page_version_key, which also changes with the page's attachments.
+    The fingerprint identifies the embedding model and chunker; changing either
+    makes every page stale so it is re-chunked on the next run.
+    """
+
+    def __init__(self, path, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self.pages = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("pages", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return {}
+
+    def save(self):
+        """Atomically write the manifest to disk"""
+        with self._lock:
+            payload = {"pages": self.pages}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def get(self, page_id):
+        with self._lock:
+            return self.pages.get(str(page_id))
+
+    def is_current(self, page_id, version):
+        """True if this page version has already been ingested"""
+        entry = self.get(page_id)
+        return (
+            entry is not None and version is not None
+            and entry.get("version") == version
+            and entry.get("fingerprint") == self.fingerprint
+        )
+
+    def update(self, page_id, version, chunk_count, source=None):
+        with self._lock:
+            self.pages[str(page_id)] = {
+                "version": version,
+                "fingerprint": self.fingerprint,
+                "source": source,
+                "chunk_count": chunk_count,
+                "ingested_at": datetime.now().isoformat()
+            }
+
+    def remove(self, page_id):
+        with self._lock:
+            return self.pages.pop(str(page_id), None)
+
+    def invalidate(self, page_ids=None):
+        """
+        Make every page (or just `page_ids`) stale so it is re-ingested, keeping its
+        chunk_count: chunks a page no longer has can still be deleted after it is re-ingested
+        """
+        with self._lock:
+            for page_id, entry in self.pages.items():
+                if page_ids is None or page_id in page_ids:
+                    entry["version"] = None
+
+    def page_ids(self):
+        with self._lock:
+            return list(self.pages.keys())
+
+
+def page_version_key(page_version, attachments=()):
+    """
+    Version recorded for a page: its version number, plus the id and version
+    of each attachment, since adding or updating an attachment doesn't bump
+    the page version. Pages without attachments keep the plain number.
+    """
+    if page_version is None or not attachments:
+        return page_version
+    parts = sorted(f"{att['id']}:{att.get('version', {}).get('number')}" for att in attachments)
+    return f"{page_version}|{','.join(parts)}"
+
+
+def make_chunk_id(page_id, chunk_index):
+    """Deterministic vector ID so re-ingesting a page overwrites its vectors in place"""
+    return f"{page_id}-{chunk_index}"
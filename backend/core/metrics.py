@@ -0,0 +1,37 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class Distribution:
+    """
+    Thread-safe record of the most recent `window` samples of a measurement,
+    summarized as count, mean, percentiles and max.
+    """
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.total_count = 0
+
+    def add(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self.total_count += 1
+
+    def summary(self, digits=3):
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64)
+            total_count = self.total_count
+        if not len(samples):
+            return {"count": total_count, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            "count": total_count,
+            "mean": round(float(samples.mean()), digits),
+            "p50": round(float(p50), digits),
+            "p95": round(float(p95), digits),
+            "p99": round(float(p99), digits),
+            "max": round(float(samples.max()), digits)
+        }
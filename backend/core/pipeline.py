@@ -1,40 +1,44 @@
-import requests
-from requests.auth import HTTPBasicAuth
-from bs4 import BeautifulSoup
 import os
-from pinecone import Pinecone
-import uuid
-from sentence_transformers import SentenceTransformer
-import io
-from pypdf import PdfReader
-from docx import Document
 import sys
+import copy
+import queue
+import threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.config import *
+from core.vector_store import get_vector_store
+from core.bm25 import get_bm25_index
+from core.embedding_cache import EmbeddingCache
+from core.embeddings import get_embedding_model
+from core.confluence_client import ConfluenceClient
+from core.manifest import IngestionManifest, make_chunk_id, page_version_key
+from core.extractors import AttachmentExtractor, clean_html, is_supported
+from core.attachment_cache import AttachmentTextCache
+from core.crawler import ConfluenceCrawler, build_crawl_queries, CRAWL_EXPAND
+from core.chunking import CharChunker, TokenChunker
+from core.index_state import bump_index_generation
+
+# Marks the end of a stage's output on the queue to the next stage
+_END_OF_STREAM = object()
 
 class KnowledgeBase:
     def __init__(self):
-        self.documents = []
-        self.pc = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = self.pc.Index(INDEX_NAME)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stage_error = None
+        self.embedding_cache = None
+        self.client = ConfluenceClient()
+        self.crawler = ConfluenceCrawler(self.client)
+        self._seen_page_ids = set()
+        self.attachment_cache = AttachmentTextCache(ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_MAX_MB * 1024 * 1024)
+        self.extractor = AttachmentExtractor(spool_dir=self.attachment_cache.spool_dir)
+        self.vector_store = get_vector_store()
+        self.bm25 = get_bm25_index()
         # Load local embedding model
         print("Loading embedding model...")
         try:
-            # Try using huggingface_hub directly to download
-            from huggingface_hub import hf_hub_download, snapshot_download
-            cache_dir = "./models_cache"
-            os.makedirs(cache_dir, exist_ok=True)
-            
-            # Download the model snapshot first
-            model_path = snapshot_download(
-                repo_id="sentence-transformers/all-MiniLM-L6-v2",
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-            print(f"Model downloaded to: {model_path}")
-            
-            # Now load the model from the local path
-            self.model = SentenceTransformer(model_path)
+            # Shared with the query-side classes, so the model is loaded once per process
+            self.model = get_embedding_model()
             print("Model loaded successfully!")
             
         except Exception as e:
@@ -64,78 +68,74 @@ class KnowledgeBase:
             
             self.model = SimpleEmbedder()
 
+        # Only cache vectors from the real model; the TF-IDF fallback is refit per call
+        model_id = getattr(self.model, "registry_id", None)
+        if EMBEDDING_CACHE_ENABLED and model_id:
+            try:
+                self.embedding_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH,
+                    model_id=model_id,
+                    max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+                )
+            except Exception as e:
+                print(f"Embedding cache disabled: {e}")
+
+        # Chunk by model tokens when the model has a tokenizer, so nothing is truncated at embed time
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is not None:
+            model_max_tokens = self.model.max_seq_length
+            # A private copy: the query path encodes with the same model, and a fast tokenizer isn't thread-safe
+            self.chunker = TokenChunker(
+                copy.deepcopy(tokenizer),
+                max_tokens=CHUNK_MAX_TOKENS or model_max_tokens - 2,  # Leave room for [CLS] and [SEP]
+                model_max_tokens=model_max_tokens
+            )
+        else:
+            self.chunker = CharChunker()
+        print(f"Chunker: {self.chunker.fingerprint}")
+
+        self.manifest = IngestionManifest(INGEST_MANIFEST_PATH, fingerprint=f"{model_id or 'tfidf'}|{self.chunker.fingerprint}")
+
     def clean_html(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = soup.get_text(separator=' ')
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        return text
-
-    def extract_text_from_pdf(self, pdf_bytes):
-        try:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            print(f"Error reading PDF: {e}")
-            return ""
-    
-    def extract_text_from_docx(self, docx_bytes):
-        try:
-            doc = Document(io.BytesIO(docx_bytes))
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            # Also extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        text += cell.text + " "
-                    text += "\n"
-            return text
-        except Exception as e:
-            print(f"Error reading DOCX: {e}")
-            return ""
-    
-    def extract_text_from_html(self, html_bytes):
-        try:
-            html_content = html_bytes.decode('utf-8', errors='ignore')
-            return self.clean_html(html_content)
-        except Exception as e:
-            print(f"Error reading HTML: {e}")
-            return ""
+        return clean_html(html_content)
 
     def get_attachments(self, page_id):
-        url = f"https://{DOMAIN}/wiki/rest/api/content/{page_id}/child/attachment"
-        response = requests.get(
-            url,
-            auth=HTTPBasicAuth(EMAIL, API_TOKEN),
-            headers={"Accept": "application/json"}
-        )
-        if response.status_code == 200:
-            return response.json().get('results', [])
+        url = f"https://{DOMAIN}/wiki/rest/api/content/{page_id}/child/attachment?expand=version"
+        status_code, data = self.client.get_json(url)
+        if status_code == 200:
+            return data.get('results', [])
         return []
 
+    def page_attachments(self, data):
+        """Attachments of a page, taken from the expanded content when it is complete"""
+        expanded = data.get("children", {}).get("attachment")
+        if expanded is not None and not expanded.get("_links", {}).get("next"):
+            return expanded.get("results", [])
+        return self.get_attachments(data["id"])
+
     def fetch_confluence_page(self, page_id):
         # 1. Fetch Page Body
-        url = f"https://{DOMAIN}/wiki/rest/api/content/{page_id}?expand=body.storage"
+        url = f"https://{DOMAIN}/wiki/rest/api/content/{page_id}?expand={CRAWL_EXPAND}"
         print(f"Fetching Confluence Page ID: {page_id}...")
-        response = requests.get(
-            url,
-            auth=HTTPBasicAuth(EMAIL, API_TOKEN),
-            headers={"Accept": "application/json"}
-        )
-        if response.status_code != 200:
-            print(f"Error fetching page {page_id}: {response.status_code}")
+        status_code, data = self.client.get_json(url)
+        if status_code != 200:
+            print(f"Error fetching page {page_id}: {status_code}")
             return None
+        return self.build_document(data)
 
-        data = response.json()
+    def build_document(self, data):
+        """
+        Turn page content (with body.storage and version expanded) into a document.
+        Returns None if this page version, with these attachment versions, has already been ingested.
+        """
+        page_id = data["id"]
         title = data["title"]
+        attachments = self.page_attachments(data)
+        version = page_version_key(data.get("version", {}).get("number"), attachments)
+        if self.manifest.is_current(page_id, version):
+            print(f"Skipping unchanged page: {title} (version {version})")
+            return None
+
         raw_html = data["body"]["storage"]["value"]
         clean_text = self.clean_html(raw_html)
         
@@ -144,8 +144,8 @@ class KnowledgeBase:
 
         # 2. Fetch Attachments
         print(f"Checking for attachments on page {page_id}...")
-        attachments = self.get_attachments(page_id)
-        attachment_text = ""
+        extracted_attachments = []
+        attachment_chars = 0
         
         for att in attachments:
             media_type = att['metadata']['mediaType']
@@ -154,109 +154,437 @@ class KnowledgeBase:
             download_url = f"https://{DOMAIN}/wiki{download_link}"
             
             print(f" - Found attachment: {filename} (Type: {media_type})")
+
+            if not is_supported(media_type):
+                print(f"   Unsupported file type: {media_type}")
+                continue
+            file_size = att.get('extensions', {}).get('fileSize') or 0
+            if file_size > self.extractor.max_bytes:
+                print(f"   Skipping {filename}: {file_size} bytes exceeds limit of {self.extractor.max_bytes}")
+                continue
+
+            # Unchanged attachments are served from the extracted text cache
+            att_version = att.get('version', {}).get('number')
+            found, extracted = self.attachment_cache.get(att['id'], att_version)
+            if found:
+                print(f"   Using cached text for {filename} (version {att_version})")
+                if extracted:
+                    extracted_attachments.append((filename, extracted))
+                    attachment_chars += extracted.char_count
+                continue
             
-            # Download the file
+            # Download the file to disk
+            file_path = None
             try:
-                file_response = requests.get(
+                status_code, file_path = self.client.download(
                     download_url,
-                    auth=HTTPBasicAuth(EMAIL, API_TOKEN)
+                    directory=self.attachment_cache.spool_dir,
+                    max_bytes=self.extractor.max_bytes
                 )
                 
-                if file_response.status_code != 200:
-                    print(f"   Failed to download: {file_response.status_code}")
+                if file_path is None:
+                    print(f"   Failed to download: {status_code}")
                     continue
                 
-                # Process based on file type
-                content = ""
-                if media_type == 'application/pdf':
-                    content = self.extract_text_from_pdf(file_response.content)
-                elif media_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document', 
-                                   'application/msword']:
-                    content = self.extract_text_from_docx(file_response.content)
-                elif media_type in ['text/html', 'application/xhtml+xml']:
-                    content = self.extract_text_from_html(file_response.content)
-                else:
-                    print(f"   Unsupported file type: {media_type}")
-                    continue
+                # Parse in the extractor process pool
+                extracted = self.extractor.extract(media_type, file_path, filename)
+                if extracted is not None:
+                    # Parse failures are not cached so they are retried next run
+                    self.attachment_cache.put(att['id'], att_version, extracted)
+                if extracted and extracted.segment_count == 0:
+                    extracted.discard()
+                    extracted = None
                 
-                if content:
-                    print(f"   Extracted {len(content)} chars from {filename}")
-                    attachment_text += f"\n\n--- Attachment: {filename} ---\n{content}"
+                if extracted:
+                    print(f"   Extracted {extracted.char_count} chars ({extracted.segment_count} segments) from {filename}")
+                    extracted_attachments.append((filename, extracted))
+                    attachment_chars += extracted.char_count
                 else:
                     print(f"   No content extracted from {filename}")
                     
             except Exception as e:
                 print(f"   Error processing {filename}: {e}")
+            finally:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
 
-        # Combine content
-        full_content = clean_text + attachment_text
-        print(f"Total Content Length to Index: {len(full_content)} chars")
+        print(f"Total Content Length to Index: {len(clean_text) + attachment_chars} chars")
         
-        return {"source": f"Confluence - {title}", "content": full_content}
-
-    def chunk_text(self, text, chunk_size=1000, overlap=100):
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            chunks.append(text[start:end])
-            start += chunk_size - overlap
-        return chunks
-
-    def upload_to_pinecone(self):
-        print("\n--- UPLOADING TO PINECONE ---")
-        records = []
-        
-        for doc in self.documents:
-            print(f"Processing: {doc['source']}")
-            chunks = self.chunk_text(doc['content'])
-            print(f" - Content Length: {len(doc['content'])} chars")
-            print(f" - Generated {len(chunks)} chunks")
-            
-            if len(chunks) == 0:
-                print(" ⚠️ WARNING: No chunks generated! Check content.")
-                continue
+        # Attachment text stays spooled on disk until the embed stage streams it
+        return {
+            "page_id": str(page_id),
+            "version": version,
+            "source": f"Confluence - {title}",
+            "body": clean_text,
+            "attachments": extracted_attachments
+        }
 
-            # Generate embeddings for all chunks at once
-            embeddings = self.model.encode(chunks)
-            
-            for i, chunk in enumerate(chunks):
-                record_id = str(uuid.uuid4())
-                
-                # Prepare the record
-                record = {
-                    "id": record_id,
-                    "values": embeddings[i].tolist(), # Convert numpy array to list
-                    "metadata": {
-                        "chunk_text": chunk,
-                        "source": doc['source'],
-                        "chunk_index": i
-                    }
-                }
-                records.append(record)
+    def iter_segments(self, doc):
+        """
+        Yield (text, metadata) segments for a document: the page body first,
+        then each attachment page by page.
+        """
+        yield doc["body"], {}
+        for filename, extracted in doc["attachments"]:
+            yield f"\n\n--- Attachment: {filename} ---\n", {"attachment": filename}
+            for text, page_number in extracted.segments():
+                meta = {"attachment": filename}
+                if page_number is not None:
+                    meta["page_number"] = page_number
+                yield text, meta
+
+    @staticmethod
+    def discard_document(doc):
+        """Delete the spooled attachment text of a document"""
+        for _, extracted in doc.get("attachments", []):
+            extracted.discard()
+
+    def encode_chunks(self, chunks):
+        """Embed chunks, reusing vectors from the on-disk cache when available"""
+        if self.embedding_cache:
+            return self.embedding_cache.encode(self.model, chunks)
+        return self.model.encode(chunks)
+
+    def chunk_text(self, text):
+        return [chunk for chunk, _ in self.chunk_segments([(text, {})])]
 
-        # Upload in batches
-        batch_size = 50
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i+batch_size]
-            print(f"Upserting batch {i//batch_size + 1}...")
+    def chunk_segments(self, segments):
+        """Yield (chunk, metadata) for a stream of (text, metadata) segments"""
+        return self.chunker.chunk(segments)
+
+    def delete_chunks(self, page_id, start, stop):
+        """Delete vectors for chunk indices [start, stop) of a page"""
+        stale_ids = [make_chunk_id(page_id, i) for i in range(start, stop)]
+        batch_size = 1000
+        for i in range(0, len(stale_ids), batch_size):
             try:
-                self.index.upsert(vectors=batch)
+                self.vector_store.delete(stale_ids[i:i+batch_size])
+                self.bm25.delete(stale_ids[i:i+batch_size])
+                bump_index_generation()
             except Exception as e:
-                print(f"Error upserting batch: {e}")
+                print(f"Error deleting stale chunks for page {page_id}: {e}")
+        if stale_ids:
+            print(f" - Removed {len(stale_ids)} stale chunks for page {page_id}")
 
-        print("--- UPLOAD COMPLETE ---")
+    def index_is_empty(self):
+        """True if the default namespace holds no document vectors (e.g. freshly created index)"""
+        try:
+            stats = self.vector_store.stats()
+            default_ns = stats['namespaces'].get('')
+            return not default_ns or default_ns['vector_count'] == 0
+        except Exception as e:
+            print(f"Could not read index stats: {e}")
+            return False
 
-    def run_pipeline(self):
+    def bm25_is_empty(self):
+        """True if the BM25 index holds no chunks (e.g. created after the vectors were ingested)"""
+        try:
+            return self.bm25.stats()['documents'] == 0
+        except Exception as e:
+            print(f"Could not read BM25 index stats: {e}")
+            return False
+
+    def rebuild_bm25(self, batch_size=100):
+        """
+        Fill the BM25 index from the chunk text stored with the vectors of every
+        ingested page, e.g. on a deployment that ingested before BM25 existed.
+        Pages with chunks missing from the vector store are re-ingested instead.
+        """
+        print("BM25 index is empty, rebuilding it from the vector store...")
+        chunk_ids = []
+        for page_id in self.manifest.page_ids():
+            entry = self.manifest.get(page_id) or {}
+            chunk_ids.extend((page_id, make_chunk_id(page_id, i)) for i in range(entry.get("chunk_count", 0)))
+
+        added = 0
+        incomplete = set()
+        for i in range(0, len(chunk_ids), batch_size):
+            batch = chunk_ids[i:i+batch_size]
+            records = self.vector_store.fetch([chunk_id for _, chunk_id in batch])
+            incomplete.update(page_id for page_id, chunk_id in batch if chunk_id not in records)
+            documents = [(chunk_id, record["metadata"]["chunk_text"]) for chunk_id, record in records.items()]
+            self.bm25.add(documents)
+            added += len(documents)
+        if added:
+            bump_index_generation()
+        if incomplete:
+            print(f" - {len(incomplete)} pages have chunks missing from the vector store, re-ingesting them")
+            self.manifest.invalidate(incomplete)
+            self.manifest.save()
+        print(f" - Added {added} chunks to the BM25 index")
+
+    def remove_deleted_pages(self, current_page_ids):
+        """Drop vectors for pages that were ingested before but are no longer in the source set"""
+        current = set(str(pid) for pid in current_page_ids)
+        for page_id in self.manifest.page_ids():
+            if page_id in current:
+                continue
+            entry = self.manifest.remove(page_id)
+            print(f"Page {page_id} is no longer in the source set, removing its vectors...")
+            self.delete_chunks(page_id, 0, entry.get("chunk_count", 0))
+        self.manifest.save()
+
+    def progress(self):
+        """Snapshot of per-stage counters, safe to call while the pipeline runs"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        crawling = bool(build_crawl_queries())
+        return {
+            "fetch": {
+                "pages_total": self.crawler.pages_discovered if crawling else len(PAGE_IDS),
+                "pages_fetched": stats.get("pages_fetched", 0),
+                "pages_skipped": stats.get("pages_skipped", 0)
+            },
+            "embed": {
+                "chunks_embedded": stats.get("chunks_embedded", 0),
+                "chunks_truncated": stats.get("chunks_truncated", 0)
+            },
+            "upsert": {
+                "vectors_upserted": stats.get("vectors_upserted", 0),
+                "pages_indexed": stats.get("pages_indexed", 0),
+                "upsert_errors": stats.get("upsert_errors", 0)
+            }
+        }
+
+    def _bump(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def _put(self, q, item):
+        """Put onto a bounded queue, giving up if the pipeline is being stopped"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Take from a queue, ending the stream early if the pipeline is being stopped"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
+
+    def _fail_stage(self, error):
+        """Stop the pipeline; run_pipeline re-raises the first stage error once the stages are joined"""
+        with self._stats_lock:
+            if self._stage_error is None:
+                self._stage_error = error
+        self._stop.set()
+
+    def _page_source(self, crawl_queries):
+        """(work items, per-item fetch function) for crawler mode or the PAGE_IDS list"""
+        if crawl_queries:
+            return self.crawler.crawl(crawl_queries), self.build_document
+        return PAGE_IDS, self.fetch_confluence_page
+
+    def _fetch_stage(self, doc_queue, crawl_queries):
+        """Stage 1: fetch pages concurrently and hand them to the embed stage"""
+        try:
+            items, fetch = self._page_source(crawl_queries)
+            for item, doc in self.client.map(fetch, items):
+                self._seen_page_ids.add(str(item["id"] if isinstance(item, dict) else item))
+                if self._stop.is_set():
+                    break
+                if not doc:
+                    self._bump("pages_skipped")
+                    continue
+                self._bump("pages_fetched")
+                if not self._put(doc_queue, doc):
+                    self.discard_document(doc)
+                    break
+        except Exception as e:
+            print(f"Fetch stage failed: {e}")
+            self._fail_stage(e)
+        finally:
+            self._put(doc_queue, _END_OF_STREAM)
+
+    def _embed_stage(self, doc_queue, batch_queue):
+        """Stage 2: chunk and embed each document, emitting fixed-size record batches"""
+        try:
+            while True:
+                doc = self._get(doc_queue)
+                if doc is _END_OF_STREAM:
+                    break
+                try:
+                    self._embed_document(doc, batch_queue)
+                finally:
+                    self.discard_document(doc)
+        except Exception as e:
+            print(f"Embed stage failed: {e}")
+            self._fail_stage(e)
+        finally:
+            self._put(batch_queue, _END_OF_STREAM)
+
+    def _embed_document(self, doc, batch_queue):
+        print(f"Processing: {doc['source']}")
+        # Only the identifying fields travel downstream, not the page content
+        page = {"page_id": doc['page_id'], "version": doc['version'], "source": doc['source']}
+
+        batch_size = INGEST_BATCH_SIZE
+        chunk_count = 0
+        batch = []
+        for chunk, meta in self.chunk_segments(self.iter_segments(doc)):
+            batch.append((chunk, meta))
+            if len(batch) == batch_size:
+                if not self._emit_batch(batch_queue, page, batch, chunk_count, last=False):
+                    return
+                chunk_count += len(batch)
+                batch = []
+
+        total = chunk_count + len(batch)
+        print(f" - Generated {total} chunks for {doc['source']}")
+        if total == 0:
+            print(" ⚠️ WARNING: No chunks generated! Check content.")
+        self._emit_batch(batch_queue, page, batch, chunk_count, last=True, total=total)
+
+    def _emit_batch(self, batch_queue, page, batch, first_index, last, total=None):
+        """Embed a batch of (chunk, metadata) pairs and queue the records for upsert"""
+        records = []
+        if batch:
+            texts = [chunk for chunk, _ in batch]
+            truncated = self.chunker.count_truncated(texts)
+            if truncated is not None:
+                self._bump("chunks_truncated", truncated)
+            embeddings = self.encode_chunks(texts)
+            for offset, (chunk, meta) in enumerate(batch):
+                i = first_index + offset
+                metadata = {
+                    "chunk_text": chunk,
+                    "source": page['source'],
+                    "page_id": page['page_id'],
+                    "chunk_index": i,
+                    # Lets the query path strip the text shared with the previous chunk
+                    "chunk_overlap": self.chunker.overlap
+                }
+                metadata.update(meta)
+                records.append({
+                    "id": make_chunk_id(page['page_id'], i),
+                    "values": embeddings[offset].tolist(), # Convert numpy array to list
+                    "metadata": metadata
+                })
+            self._bump("chunks_embedded", len(records))
+
+        return self._put(batch_queue, {
+            "page": page,
+            "records": records,
+            "last": last,
+            "chunk_count": total
+        })
+
+    def _upsert_stage(self, batch_queue):
+        """Stage 3: upsert record batches and finalize each page once all of its batches landed"""
+        failed_pages = set()
+        while True:
+            item = self._get(batch_queue)
+            if item is _END_OF_STREAM:
+                break
+            page = item["page"]
+            page_id = page['page_id']
+
+            if item["records"] and page_id not in failed_pages:
+                print(f"Upserting {len(item['records'])} vectors for page {page_id}...")
+                try:
+                    self.vector_store.upsert(item["records"])
+                    self.bm25.add((record["id"], record["metadata"]["chunk_text"]) for record in item["records"])
+                    bump_index_generation()
+                    self._bump("vectors_upserted", len(item["records"]))
+                except Exception as e:
+                    print(f"Error upserting batch: {e}")
+                    self._bump("upsert_errors")
+                    failed_pages.add(page_id)
+
+            if not item["last"]:
+                continue
+            if page_id in failed_pages:
+                # Leave the manifest untouched so the page is retried next run
+                failed_pages.discard(page_id)
+                continue
+
+            # Remove chunks the page no longer has
+            previous = self.manifest.get(page_id)
+            if previous:
+                self.delete_chunks(page_id, item["chunk_count"], previous.get("chunk_count", 0))
+            self.manifest.update(page_id, page['version'], item["chunk_count"], page['source'])
+            self.manifest.save()
+            self._bump("pages_indexed")
+
+    def run_pipeline(self, force=False):
+        """
+        Streaming ingestion: fetch -> chunk/embed -> upsert.
+        Stages run concurrently and are joined by bounded queues, so memory stays
+        flat regardless of corpus size and upserts start as soon as the first page
+        is embedded.
+        """
         print("--- STARTING PIPELINE ---")
-        # 1. Fetch Data (Confluence ONLY)
-        for pid in PAGE_IDS:
-            doc = self.fetch_confluence_page(pid)
-            if doc:
-                self.documents.append(doc)
-
-        # 2. Upload to Pinecone
-        self.upload_to_pinecone()
+        self.stats = {}
+        self._stop.clear()
+        self._stage_error = None
+        self._seen_page_ids = set()
+        crawl_queries = build_crawl_queries()
+        if force or self.index_is_empty():
+            # Nothing we recorded is actually in the index, re-ingest everything
+            print("Full ingestion: ignoring stored page versions")
+            self.manifest.invalidate()
+            self.manifest.save()
+        elif self.bm25_is_empty():
+            # BM25 is only filled on upsert, so unchanged pages would never reach it
+            self.rebuild_bm25()
+        if not crawl_queries:
+            self.remove_deleted_pages(PAGE_IDS)
+
+        if crawl_queries:
+            print(f"Crawling {len(crawl_queries)} CQL queries with {self.client.max_workers} workers...")
+        else:
+            print(f"Fetching {len(PAGE_IDS)} pages with {self.client.max_workers} workers...")
+        doc_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        batch_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        stages = [
+            threading.Thread(target=self._fetch_stage, args=(doc_queue, crawl_queries), name="ingest-fetch", daemon=True),
+            threading.Thread(target=self._embed_stage, args=(doc_queue, batch_queue), name="ingest-embed", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            self._upsert_stage(batch_queue)
+        except Exception:
+            self._stop.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+            # Discard spooled text of any documents left behind by an aborted run
+            while not doc_queue.empty():
+                doc = doc_queue.get_nowait()
+                if doc is not _END_OF_STREAM:
+                    self.discard_document(doc)
+
+        # A failed fetch or embed stage fails the run, rather than ending it early with partial stats
+        if self._stage_error is not None:
+            self.extractor.shutdown()
+            self.attachment_cache.save()
+            raise self._stage_error
+
+        # Pages the crawler no longer finds were deleted or moved out of scope
+        if crawl_queries and self.crawler.complete and not self._stop.is_set():
+            self.stats["pages_discovered"] = self.crawler.pages_discovered
+            self.remove_deleted_pages(self._seen_page_ids)
+
+        self.extractor.shutdown()
+        self.attachment_cache.save()
+        print(f"Attachment text cache: {self.attachment_cache.stats()}")
+        if self.embedding_cache:
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
+        if self.stats.get("chunks_embedded") and "chunks_truncated" in self.stats:
+            self.stats["truncation_rate"] = self.stats["chunks_truncated"] / self.stats["chunks_embedded"]
+        print(f"Pipeline stats: {self.stats}")
+        print("--- PIPELINE COMPLETE ---")
+        return self.stats
 
 if __name__ == "__main__":
     kb = KnowledgeBase()
@@ -0,0 +1,75 @@
+import threading
+import time
+from datetime import datetime
+
+from core.logger import setup_logger
+
+logger = setup_logger('startup')
+
+
+class StartupTracker:
+    """
+    Records the state and duration of each startup phase so liveness and
+    readiness probes can report how far initialization has got.
+    The app is ready once every phase in `required` has completed.
+    """
+
+    def __init__(self, phases, required):
+        self.started_at = time.monotonic()
+        self.required = set(required)
+        self._lock = threading.Lock()
+        self.phases = {
+            name: {"status": "pending", "started_at": None, "duration_seconds": None, "error": None}
+            for name in phases
+        }
+
+    def start(self, name):
+        with self._lock:
+            phase = self.phases[name]
+            phase["status"] = "running"
+            phase["started_at"] = datetime.now().isoformat()
+            phase["_start"] = time.monotonic()
+        logger.info(f"[STARTUP] {name} started")
+
+    def finish(self, name, status="completed", error=None):
+        with self._lock:
+            phase = self.phases[name]
+            if "_start" in phase:
+                phase["duration_seconds"] = round(time.monotonic() - phase["_start"], 3)
+            phase["status"] = status
+            phase["error"] = error
+        logger.info(f"[STARTUP] {name} {status} in {phase['duration_seconds']}s")
+
+    def skip(self, name, reason=None):
+        with self._lock:
+            self.phases[name]["status"] = "skipped"
+            self.phases[name]["error"] = reason
+        logger.info(f"[STARTUP] {name} skipped{f': {reason}' if reason else ''}")
+
+    def run(self, name, fn, *args, **kwargs):
+        """Run one phase, recording its outcome; exceptions are recorded and re-raised"""
+        self.start(name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.finish(name, status="failed", error=str(e))
+            raise
+        self.finish(name)
+        return result
+
+    def is_ready(self):
+        with self._lock:
+            return all(self.phases[name]["status"] == "completed" for name in self.required)
+
+    def report(self):
+        with self._lock:
+            phases = {}
+            for name, phase in self.phases.items():
+                phases[name] = {key: value for key, value in phase.items() if not key.startswith("_")}
+                if phase["status"] == "running":
+                    phases[name]["duration_seconds"] = round(time.monotonic() - phase["_start"], 3)
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "phases": phases
+        }
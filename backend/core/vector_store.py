@@ -0,0 +1,476 @@
+import abc
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from core.config import (
+    VECTOR_STORE, VECTOR_DIMENSION, PINECONE_API_KEY, INDEX_NAME,
+    LOCAL_VECTOR_STORE_DIR, LOCAL_VECTOR_DTYPE, IVF_MIN_VECTORS, IVF_NPROBE
+)
+from core.logger import setup_logger
+
+logger = setup_logger('vector_store')
+
+
+class VectorStore(abc.ABC):
+    """
+    Interface of the vector index used for documents and user records.
+
+    Records are dicts {"id", "values", "metadata"}. query() returns
+    {"matches": [{"id", "score", "metadata"}, ...]} best first, scored by
+    cosine similarity. `namespace` "" is the default (document) namespace.
+    """
+
+    @abc.abstractmethod
+    def upsert(self, vectors, namespace=""):
+        pass
+
+    @abc.abstractmethod
+    def query(self, vector, top_k=10, include_metadata=True, filter=None, namespace=""):
+        pass
+
+    @abc.abstractmethod
+    def fetch(self, ids, namespace=""):
+        """Dict of id -> record for the ids that exist"""
+
+    @abc.abstractmethod
+    def delete(self, ids, namespace=""):
+        pass
+
+    @abc.abstractmethod
+    def stats(self):
+        """{"dimension", "total_vector_count", "index_fullness", "namespaces": {name: {"vector_count"}}}"""
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index_name=INDEX_NAME, api_key=PINECONE_API_KEY):
+        from pinecone import Pinecone
+        self.pc = Pinecone(api_key=api_key)
+        self.index = self.pc.Index(index_name)
+
+    def upsert(self, vectors, namespace=""):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k=10, include_metadata=True, filter=None, namespace=""):
+        query_args = {"filter": filter} if filter else {}
+        results = self.index.query(
+            vector=list(vector),
+            top_k=top_k,
+            include_metadata=include_metadata,
+            namespace=namespace,
+            **query_args
+        )
+        return {"matches": [
+            {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+            for match in results['matches']
+        ]}
+
+    def fetch(self, ids, namespace=""):
+        response = self.index.fetch(ids=list(ids), namespace=namespace)
+        return {
+            vector_id: {"id": vector_id, "values": list(vector.values), "metadata": vector.metadata or {}}
+            for vector_id, vector in response.vectors.items()
+        }
+
+    def delete(self, ids, namespace=""):
+        self.index.delete(ids=list(ids), namespace=namespace)
+
+    def stats(self):
+        stats = self.index.describe_index_stats()
+        return {
+            "dimension": stats.get('dimension', 0),
+            "total_vector_count": stats.get('total_vector_count', 0),
+            "index_fullness": stats.get('index_fullness', 0),
+            "namespaces": {
+                name: {"vector_count": ns['vector_count']}
+                for name, ns in (stats.get('namespaces') or {}).items()
+            }
+        }
+
+
+def _compare(op, value, operand):
+    if isinstance(value, list) and op in ("$eq", "$in"):
+        # List-valued metadata matches if any element does
+        return any(_compare(op, item, operand) for item in value)
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    if op == "$lt":
+        return value < operand
+    if op == "$lte":
+        return value <= operand
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def matches_filter(metadata, metadata_filter):
+    """Evaluate a Pinecone-style metadata filter ($eq, $ne, $in, $nin, $gt(e), $lt(e), $and, $or)"""
+    for key, condition in metadata_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            if not all(_compare(op, value, operand) for op, operand in condition.items()):
+                return False
+    return True
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _LocalNamespace:
+    """
+    Vectors of one namespace: a memory-mapped matrix of unit-length vectors
+    (rows are never moved except by compact()) and an SQLite sidecar mapping
+    rows to ids and metadata. Metadata is also held in memory for fast reads.
+
+    Small namespaces are searched exactly. From IVF_MIN_VECTORS vectors on, an
+    IVF index (spherical k-means, sqrt(n) lists) restricts each query to the
+    rows of the IVF_NPROBE closest lists; it is retrained once the namespace
+    has doubled, and new rows are assigned to their closest list meanwhile.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, directory, dimension, dtype, ivf_min_vectors=IVF_MIN_VECTORS, nprobe=IVF_NPROBE):
+        os.makedirs(directory, exist_ok=True)
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self._row_bytes = dimension * self.dtype.itemsize
+
+        self.conn = sqlite3.connect(os.path.join(directory, "metadata.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                metadata TEXT NOT NULL
+            )"""
+        )
+        self.conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self.conn.execute("SELECT row, id, metadata FROM records").fetchall()
+        self.row_of = {vector_id: row for row, vector_id, _ in rows}
+        self.id_of = {row: vector_id for row, vector_id, _ in rows}
+        self.metadata = {row: json.loads(metadata) for row, _, metadata in rows}
+        self.size = max(self.id_of) + 1 if self.id_of else 0
+
+        existing = os.path.getsize(self.vectors_path) // self._row_bytes if os.path.exists(self.vectors_path) else 0
+        self._open(max(existing, self.size, self.INITIAL_CAPACITY))
+        self.live = np.zeros(self.capacity, dtype=bool)
+        if self.id_of:
+            self.live[list(self.id_of)] = True
+        self._reset_ivf()
+
+    def _open(self, capacity):
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < capacity * self._row_bytes:
+                f.truncate(capacity * self._row_bytes)
+        self.capacity = capacity
+        self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dimension))
+
+    def _grow(self, needed):
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.matrix.flush()
+        del self.matrix
+        self._open(capacity)
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+        if self.assignment is not None:
+            assignment = np.full(capacity, -1, dtype=np.int32)
+            assignment[:len(self.assignment)] = self.assignment
+            self.assignment = assignment
+
+    def _reset_ivf(self):
+        self.centroids = None
+        self.assignment = None
+        self._lists = None
+        self._trained_count = 0
+
+    @property
+    def count(self):
+        return len(self.id_of)
+
+    def upsert(self, records):
+        rows, vectors, sidecar = [], [], []
+        for record in records:
+            vector = _unit(record["values"])
+            if vector.shape != (self.dimension,):
+                raise ValueError(f"Vector {record['id']} has dimension {vector.shape}, expected {self.dimension}")
+            row = self.row_of.get(record["id"])
+            if row is None:
+                row = self.size
+                self.size += 1
+                self._grow(self.size)
+                self.row_of[record["id"]] = row
+                self.id_of[row] = record["id"]
+            metadata = record.get("metadata") or {}
+            self.metadata[row] = metadata
+            self.live[row] = True
+            rows.append(row)
+            vectors.append(vector)
+            sidecar.append((row, record["id"], json.dumps(metadata)))
+
+        if not rows:
+            return
+        rows = np.array(rows)
+        block = np.vstack(vectors)
+        self.matrix[rows] = block.astype(self.dtype)
+        self.matrix.flush()
+        self.conn.executemany("INSERT OR REPLACE INTO records (row, id, metadata) VALUES (?, ?, ?)", sidecar)
+        self.conn.commit()
+        if self.centroids is not None:
+            self.assignment[rows] = np.argmax(block @ self.centroids.T, axis=1)
+            self._lists = None
+
+    def delete(self, ids):
+        rows = [self.row_of.pop(vector_id) for vector_id in ids if vector_id in self.row_of]
+        if not rows:
+            return
+        for row in rows:
+            del self.id_of[row]
+            del self.metadata[row]
+        self.live[rows] = False
+        self.conn.executemany("DELETE FROM records WHERE row = ?", [(row,) for row in rows])
+        self.conn.commit()
+        self._lists = None
+        # Reclaim space once most rows are dead
+        dead = self.size - self.count
+        if dead > max(self.INITIAL_CAPACITY, self.count):
+            self.compact()
+
+    def compact(self):
+        """Move live rows to the front of the matrix and renumber them in the sidecar"""
+        live_rows = np.nonzero(self.live[:self.size])[0]
+        for new_row, old_row in enumerate(live_rows):
+            if new_row != old_row:
+                self.matrix[new_row] = self.matrix[old_row]
+        self.matrix.flush()
+        # Ascending order: the target row is always free by the time it is used
+        self.conn.executemany(
+            "UPDATE records SET row = ? WHERE row = ?",
+            [(new_row, int(old_row)) for new_row, old_row in enumerate(live_rows) if new_row != old_row]
+        )
+        self.conn.commit()
+        del self.matrix
+        self._load()
+        logger.info(f"Compacted local vector namespace to {self.count} rows")
+
+    def _train_ivf(self):
+        live_rows = np.nonzero(self.live[:self.size])[0]
+        n = len(live_rows)
+        n_lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(live_rows, size=min(n, n_lists * 64), replace=False))
+        sample = np.asarray(self.matrix[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(10):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(n_lists):
+                members = sample[labels == k]
+                if len(members):
+                    centroids[k] = _unit(members.mean(axis=0))
+
+        self.centroids = centroids
+        self.assignment = np.full(self.capacity, -1, dtype=np.int32)
+        for start in range(0, len(live_rows), 8192):
+            rows = live_rows[start:start+8192]
+            self.assignment[rows] = np.argmax(np.asarray(self.matrix[rows], dtype=np.float32) @ centroids.T, axis=1)
+        self._lists = None
+        self._trained_count = n
+        logger.info(f"Trained IVF index: {n} vectors in {n_lists} lists")
+
+    def _ivf_lists(self):
+        if self._lists is None:
+            rows = np.nonzero(self.live[:self.size])[0]
+            labels = self.assignment[rows]
+            order = np.argsort(labels, kind="stable")
+            bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+            self._lists = [rows[order[bounds[k]:bounds[k + 1]]] for k in range(len(self.centroids))]
+        return self._lists
+
+    def _candidates(self, query):
+        """Rows worth scoring for this query, or None to scan every row"""
+        if self.count < self.ivf_min_vectors:
+            return None
+        if self.centroids is None or self.count > 2 * self._trained_count:
+            self._train_ivf()
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        lists = self._ivf_lists()
+        return np.concatenate([lists[k] for k in probes])
+
+    def _score(self, query, rows):
+        if rows is None:
+            scores = np.asarray(self.matrix[:self.size], dtype=np.float32) @ query
+            scores[~self.live[:self.size]] = -np.inf
+            return np.arange(self.size), scores
+        return rows, np.asarray(self.matrix[rows], dtype=np.float32) @ query
+
+    def query(self, vector, top_k, include_metadata, metadata_filter):
+        if not self.count or top_k <= 0:
+            return []
+        query = _unit(vector)
+        rows, scores = self._score(query, self._candidates(query))
+
+        if metadata_filter:
+            selected = self._filtered(rows, scores, top_k, metadata_filter)
+            if len(selected) < top_k and len(rows) < self.size:
+                # The probed lists held too few matching rows; fall back to an exact scan
+                rows, scores = self._score(query, None)
+                selected = self._filtered(rows, scores, top_k, metadata_filter)
+        else:
+            if len(rows) < top_k and len(rows) < self.size:
+                # The probed lists (possibly empty) hold fewer than top_k rows; fall back to an exact scan
+                rows, scores = self._score(query, None)
+            k = min(top_k, len(scores))
+            if not k:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            selected = [(rows[i], scores[i]) for i in top[np.argsort(-scores[top])] if np.isfinite(scores[i])]
+
+        return [{
+            "id": self.id_of[int(row)],
+            "score": float(score),
+            "metadata": dict(self.metadata[int(row)]) if include_metadata else {}
+        } for row, score in selected]
+
+    def _filtered(self, rows, scores, top_k, metadata_filter):
+        selected = []
+        for i in np.argsort(-scores):
+            if not np.isfinite(scores[i]):
+                break
+            row = int(rows[i])
+            if matches_filter(self.metadata[row], metadata_filter):
+                selected.append((row, scores[i]))
+                if len(selected) == top_k:
+                    break
+        return selected
+
+    def fetch(self, ids):
+        records = {}
+        for vector_id in ids:
+            row = self.row_of.get(vector_id)
+            if row is not None:
+                records[vector_id] = {
+                    "id": vector_id,
+                    "values": np.asarray(self.matrix[row], dtype=np.float32).tolist(),
+                    "metadata": dict(self.metadata[row])
+                }
+        return records
+
+
+class LocalVectorStore(VectorStore):
+    """
+    On-disk vector store for offline development and benchmarks: one
+    directory per namespace, each holding a memory-mapped float32 or float16
+    vector matrix with an IVF index and an SQLite metadata sidecar.
+    Stored vectors are unit length, so float16 halves memory at negligible
+    cost to cosine scores. Open one instance per directory per process.
+    """
+
+    def __init__(self, directory=LOCAL_VECTOR_STORE_DIR, dimension=VECTOR_DIMENSION, dtype=LOCAL_VECTOR_DTYPE):
+        self.directory = directory
+        self.dimension = dimension
+        self.dtype = dtype
+        self._namespaces = {}
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if os.path.isdir(os.path.join(directory, name)):
+                self._namespace(self._namespace_name(name))
+
+    @staticmethod
+    def _directory_name(namespace):
+        return "default" if not namespace else "ns-" + re.sub(r'[^A-Za-z0-9_.-]', '_', namespace)
+
+    @staticmethod
+    def _namespace_name(directory_name):
+        return "" if directory_name == "default" else directory_name[len("ns-"):]
+
+    def _namespace(self, namespace):
+        if namespace not in self._namespaces:
+            path = os.path.join(self.directory, self._directory_name(namespace))
+            self._namespaces[namespace] = _LocalNamespace(path, self.dimension, self.dtype)
+        return self._namespaces[namespace]
+
+    def upsert(self, vectors, namespace=""):
+        with self._lock:
+            self._namespace(namespace).upsert(vectors)
+
+    def query(self, vector, top_k=10, include_metadata=True, filter=None, namespace=""):
+        with self._lock:
+            return {"matches": self._namespace(namespace).query(vector, top_k, include_metadata, filter)}
+
+    def fetch(self, ids, namespace=""):
+        with self._lock:
+            return self._namespace(namespace).fetch(ids)
+
+    def delete(self, ids, namespace=""):
+        with self._lock:
+            self._namespace(namespace).delete(ids)
+
+    def stats(self):
+        with self._lock:
+            namespaces = {name: {"vector_count": ns.count} for name, ns in self._namespaces.items() if ns.count}
+        return {
+            "dimension": self.dimension,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+            "index_fullness": 0.0,
+            "namespaces": namespaces
+        }
+
+
+# One store per process: the local backend must not be opened twice
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store(backend=VECTOR_STORE):
+    """The process-wide vector store selected by VECTOR_STORE (pinecone or local)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if backend == "local":
+                _store = LocalVectorStore()
+                logger.info(f"Using local vector store at {LOCAL_VECTOR_STORE_DIR} ({LOCAL_VECTOR_DTYPE})")
+            elif backend == "pinecone":
+                _store = PineconeVectorStore()
+                logger.info(f"Using Pinecone index: {INDEX_NAME}")
+            else:
+                raise ValueError(f"Unknown VECTOR_STORE: {backend}")
+        return _store
@@ -2,14 +2,17 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import sys
 import os
+import threading
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.config import *
 from core.logger import setup_logger
+from core.startup import StartupTracker
 from services.knowledge_base import KnowledgeBase
 from services.agent import Agent
+from services.ingestion_jobs import IngestionJobManager
 from routers import chat, knowledge_base, health, auth
 
 logger = setup_logger('main')
@@ -32,54 +35,114 @@ app.add_middleware(
 # Global instances
 kb = None
 agent = None
+ingestion_jobs = None
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
-    global kb, agent
-    logger.info("="*60)
-    logger.info("Starting Agentic AI Assistant API")
-    logger.info("="*60)
-    
+# Ingestion only gates readiness when it runs before the services start
+startup = StartupTracker(
+    phases=["database", "ingestion", "services"],
+    required=["database", "services"] + (["ingestion"] if STARTUP_INGESTION == "blocking" else [])
+)
+health.set_startup_tracker(startup)
+
+def _run_startup_ingestion():
+    """Run the startup ingestion job and record it as the ingestion phase"""
+    startup.start("ingestion")
+    job = ingestion_jobs.wait(ingestion_jobs.start()["job_id"])
+    if job["status"] == "failed":
+        startup.finish("ingestion", status="failed", error=job["error"])
+        raise RuntimeError(f"Data ingestion failed: {job['error']}")
+    startup.finish("ingestion")
+    logger.info("[INGESTION] Data ingestion complete")
+    print("✅ Data ingestion complete")
+
+def _run_background_ingestion():
     try:
-        # 1. Setup database (Safe check - RE-ENABLED for user preference)
-        # The user WANTS to delete and create new index every time as per request "everytime i need delete old index and create new one"
-        # This implies they rely on a fresh state to ensure data integrity/extraction works.
-        logger.info("[SETUP] Setting up database...")
-        print("🗂️ Setting up database...")
-        from scripts.setup_db import setup_pinecone
-        index = setup_pinecone()
-        logger.info("[SETUP] Database setup complete")
-        print("✅ Database setup complete")
-        
-        # 2. Run pipeline to ingest data (RE-ENABLED)
+        _run_startup_ingestion()
+    except Exception as e:
+        logger.error(f"[ERROR] Background ingestion failed: {e}")
+
+def initialize_services():
+    """Run the startup phases in order; the app is ready once the query path is up"""
+    global ingestion_jobs
+    # 1. Setup database (Safe check - RE-ENABLED for user preference)
+    # The user WANTS to delete and create new index every time as per request "everytime i need delete old index and create new one"
+    # This implies they rely on a fresh state to ensure data integrity/extraction works.
+    logger.info("[SETUP] Setting up database...")
+    print("🗂️ Setting up database...")
+    from scripts.setup_db import setup_vector_store
+    startup.run("database", setup_vector_store)
+    logger.info("[SETUP] Database setup complete")
+    print("✅ Database setup complete")
+
+    from core.pipeline import KnowledgeBase as PipelineKnowledgeBase
+    ingestion_jobs = IngestionJobManager(PipelineKnowledgeBase)
+    knowledge_base.set_ingestion_jobs(ingestion_jobs)
+
+    # 2. Run pipeline to ingest data before serving queries (STARTUP_INGESTION=blocking)
+    if STARTUP_INGESTION == "blocking":
         logger.info("[INGESTION] Running data ingestion pipeline...")
         print("📥 Running data ingestion pipeline...")
-        from core.pipeline import KnowledgeBase
-        pipeline_kb = KnowledgeBase()
-        pipeline_kb.run_pipeline()
-        logger.info("[INGESTION] Data ingestion complete")
-        print("✅ Data ingestion complete")
-        
-        # 3. Initialize services
-        logger.info("[INIT] Initializing services...")
-        print("🚀 Initializing services...")
+        _run_startup_ingestion()
+
+    # 3. Initialize services
+    logger.info("[INIT] Initializing services...")
+    print("🚀 Initializing services...")
+
+    def load_query_services():
+        global kb, agent
         kb = KnowledgeBase()
         agent = Agent()
-        
+
         # Set instances in routers
         chat.set_agent_instance(agent)
         knowledge_base.set_kb_instance(kb)
         health.set_instances(kb, agent)
-        
-        logger.info("[SUCCESS] Services initialized successfully")
-        logger.info("API is ready to accept requests")
-        print("✅ Services initialized successfully")
+
+    startup.run("services", load_query_services)
+    logger.info("[SUCCESS] Services initialized successfully")
+    logger.info("API is ready to accept requests")
+    print("✅ Services initialized successfully")
+
+    # 4. Ingest in the background while queries are served, or not at all
+    if STARTUP_INGESTION == "background":
+        logger.info("[INGESTION] Starting background ingestion")
+        threading.Thread(target=_run_background_ingestion, name="startup-ingestion", daemon=True).start()
+    elif STARTUP_INGESTION != "blocking":
+        startup.skip("ingestion", f"STARTUP_INGESTION={STARTUP_INGESTION}")
+
+def _initialize_in_background():
+    try:
+        initialize_services()
+    except Exception as e:
+        logger.error(f"[ERROR] Failed to initialize services: {e}", exc_info=True)
+        print(f"❌ Failed to initialize services: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize services on startup"""
+    logger.info("="*60)
+    logger.info("Starting Agentic AI Assistant API")
+    logger.info("="*60)
+
+    if FAST_START:
+        # Start serving at once; /api/health/ready reports when the query path is up
+        logger.info("[STARTUP] Fast start: initializing services in the background")
+        threading.Thread(target=_initialize_in_background, name="startup", daemon=True).start()
+        return
+
+    try:
+        initialize_services()
     except Exception as e:
         logger.error(f"[ERROR] Failed to initialize services: {e}", exc_info=True)
         print(f"❌ Failed to initialize services: {e}")
         raise e
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the async Azure client"""
+    if agent:
+        await agent.aclose()
+
 # Include routers
 app.include_router(health.router, prefix="/api")
 app.include_router(knowledge_base.router, prefix="/api")
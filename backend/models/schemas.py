@@ -14,10 +14,17 @@ class QueryResponse(BaseModel):
     sources: List[dict]
     confidence_scores: List[float]
 
-class IngestResponse(BaseModel):
-    message: str
-    documents_processed: int
-    chunks_uploaded: int
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed or failed
+    force: bool = False
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    elapsed_seconds: float = 0.0
+    progress: dict = {}
+    result: Optional[dict] = None
+    error: Optional[str] = None
 
 class HealthResponse(BaseModel):
     status: str
@@ -53,6 +60,11 @@ class ConversationDetail(BaseModel):
     updated_at: str
     messages: List[Message]
 
+class ConversationTitleResponse(BaseModel):
+    thread_id: str
+    title: str
+    status: str  # pending (generated title on its way) or final
+
 class ConversationListResponse(BaseModel):
     conversations: List[Conversation]
 
@@ -1,5 +1,8 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import List
+import json
 import sys
 import os
 
@@ -12,7 +15,7 @@ from services.agent import Agent
 from models.schemas import (
     QueryRequest, QueryResponse, 
     ConversationListResponse, ConversationDetail,
-    CreateConversationResponse, Conversation
+    CreateConversationResponse, Conversation, ConversationTitleResponse
 )
 
 logger = setup_logger('chat_router')
@@ -26,6 +29,56 @@ def set_agent_instance(agent_instance):
     global agent
     agent = agent_instance
 
+def thread_for_unanswered(thread_id):
+    """The request's thread, or a minimal new thread entry when there is none"""
+    if thread_id:
+        return thread_id
+    from datetime import datetime
+    import uuid
+    thread_id = f"thread_{uuid.uuid4().hex[:16]}"
+    agent.conversations[thread_id] = {
+        "thread_id": thread_id,
+        "title": None,
+        "created_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat(),
+        "messages": []
+    }
+    return thread_id
+
+def sources_from_matches(matches):
+    """One source entry per page, with the score of its best match"""
+    sources = []
+    confidence_scores = []
+    
+    seen_sources = set()
+    
+    for match in matches:
+        source_name = match['metadata']['source']
+        if source_name not in seen_sources:
+            sources.append({
+                "source": source_name,
+                "chunk_text": match['metadata']['chunk_text'][:200] + "...",
+                "chunk_index": match['metadata']['chunk_index']
+            })
+            confidence_scores.append(match['score'])
+            seen_sources.add(source_name)
+    return sources, confidence_scores
+
+def conversation_title_for(thread_id, query):
+    """
+    Title of a conversation. A new conversation gets an extractive title from
+    its first question at once; the generated title replaces it in the
+    background (see GET /conversations/{thread_id}/title).
+    """
+    if thread_id not in agent.conversations:
+        return "New Conversation"
+    if not agent.conversations[thread_id].get("title"):
+        return agent.start_conversation_title(thread_id, query)
+    return agent.conversations[thread_id].get("title") or "New Conversation"
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/chat", response_model=QueryResponse, tags=["Chat"])
 async def chat_with_knowledge_base(request: QueryRequest):
     """Chat with the knowledge base with a natural language question"""
@@ -40,26 +93,15 @@ async def chat_with_knowledge_base(request: QueryRequest):
             raise Exception("Agent not initialized")
         
         logger.info("Searching knowledge base...")
-        # Search knowledge base
-        matches = agent.search_knowledge_base(request.query, request.top_k)
+        # Search knowledge base off the event loop, so concurrent queries can share an embedding batch
+        matches = await run_in_threadpool(agent.search_knowledge_base, request.query, request.top_k)
+        # Keep the chunks the cross-encoder rates best (a no-op unless RERANK_ENABLED)
+        matches = await run_in_threadpool(agent.rerank, request.query, matches)
         
         if not matches:
             logger.warning("No matches found in knowledge base")
             # Still create/use thread even with no matches
-            if request.thread_id:
-                thread_id = request.thread_id
-            else:
-                # Create a minimal thread entry
-                from datetime import datetime
-                import uuid
-                thread_id = f"thread_{uuid.uuid4().hex[:16]}"
-                agent.conversations[thread_id] = {
-                    "thread_id": thread_id,
-                    "title": None,
-                    "created_at": datetime.now().isoformat(),
-                    "updated_at": datetime.now().isoformat(),
-                    "messages": []
-                }
+            thread_id = thread_for_unanswered(request.thread_id)
             
             return QueryResponse(
                 answer="I couldn't find any information about that in the knowledge base.",
@@ -70,35 +112,19 @@ async def chat_with_knowledge_base(request: QueryRequest):
             )
         
         logger.info(f"Found {len(matches)} matches, generating answer...")
-        # Generate answer with thread support
-        answer, thread_id, used_matches = agent.generate_answer(request.query, matches, request.thread_id)
+        # A new conversation's first question may already have been answered
+        cached = None if request.thread_id else await run_in_threadpool(agent.answer_from_cache, request.query, matches)
+        if cached:
+            answer, thread_id, used_matches = cached
+        else:
+            # Generate answer with thread support; awaiting the run leaves the event loop free
+            answer, thread_id, used_matches = await agent.agenerate_answer(request.query, matches, request.thread_id)
         
         # Generate conversation title if this is a new conversation
-        conversation_title = "New Conversation"
-        if thread_id in agent.conversations:
-            if not agent.conversations[thread_id].get("title"):
-                # Generate title from first message
-                conversation_title = agent.generate_conversation_title(request.query)
-                agent.update_conversation_title(thread_id, conversation_title)
-            else:
-                conversation_title = agent.conversations[thread_id].get("title") or "New Conversation"
+        conversation_title = conversation_title_for(thread_id, request.query)
         
         # Extract sources and scores
-        sources = []
-        confidence_scores = []
-        
-        seen_sources = set()
-        
-        for match in used_matches:
-            source_name = match['metadata']['source']
-            if source_name not in seen_sources:
-                sources.append({
-                    "source": source_name,
-                    "chunk_text": match['metadata']['chunk_text'][:200] + "...",
-                    "chunk_index": match['metadata']['chunk_index']
-                })
-                confidence_scores.append(match['score'])
-                seen_sources.add(source_name)
+        sources, confidence_scores = sources_from_matches(used_matches)
         
         logger.info(f"Successfully generated answer (length: {len(answer)} chars)")
         logger.info(f"Thread ID: {thread_id}, Title: {conversation_title}")
@@ -116,6 +142,73 @@ async def chat_with_knowledge_base(request: QueryRequest):
         logger.error(f"Chat endpoint error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+@router.post("/chat/stream", tags=["Chat"])
+async def stream_chat_with_knowledge_base(request: QueryRequest):
+    """
+    Chat with the knowledge base, streamed as server-sent events:
+    `retrieval` (the retrieved chunks), `thread`, `token` (answer text as it is
+    generated), `tool_call` / `tool_result` (e.g. Jira ticket creation),
+    `sources` (the sources the answer used) and finally `done` with the whole
+    answer and the conversation title. Errors end the stream with `error`.
+    """
+    logger.info(f"=== New Streaming Chat Request ===")
+    logger.info(f"Query: '{request.query}'")
+    logger.info(f"Thread ID: {request.thread_id}")
+
+    if not agent:
+        logger.error("Agent not initialized")
+        raise HTTPException(status_code=503, detail="Agent not initialized")
+
+    async def events():
+        try:
+            matches = await run_in_threadpool(agent.search_knowledge_base, request.query, request.top_k)
+            matches = await run_in_threadpool(agent.rerank, request.query, matches)
+            retrieved, retrieved_scores = sources_from_matches(matches)
+            yield sse_event("retrieval", {"sources": retrieved, "confidence_scores": retrieved_scores})
+
+            if not matches:
+                logger.warning("No matches found in knowledge base")
+                answer = "I couldn't find any information about that in the knowledge base."
+                yield sse_event("token", {"text": answer})
+                yield sse_event("sources", {"sources": [], "confidence_scores": []})
+                yield sse_event("done", {
+                    "answer": answer,
+                    "thread_id": thread_for_unanswered(request.thread_id),
+                    "conversation_title": "New Conversation"
+                })
+                return
+
+            # A new conversation's first question may already have been answered
+            cached = None if request.thread_id else await run_in_threadpool(agent.answer_from_cache, request.query, matches)
+            if cached:
+                answer, thread_id, used_matches = cached
+                yield sse_event("thread", {"thread_id": thread_id})
+                yield sse_event("token", {"text": answer})
+            else:
+                async for event, data in agent.astream_answer(request.query, matches, request.thread_id):
+                    if event == "answer":
+                        answer, thread_id, used_matches = data["answer"], data["thread_id"], data["used_matches"]
+                    else:
+                        yield sse_event(event, data)
+
+            sources, confidence_scores = sources_from_matches(used_matches)
+            yield sse_event("sources", {"sources": sources, "confidence_scores": confidence_scores})
+
+            conversation_title = conversation_title_for(thread_id, request.query)
+            logger.info(f"Streamed answer (length: {len(answer)} chars), Thread ID: {thread_id}")
+            yield sse_event("done", {
+                "answer": answer,
+                "thread_id": thread_id,
+                "conversation_title": conversation_title
+            })
+        except Exception as e:
+            logger.error(f"Streaming chat error: {str(e)}", exc_info=True)
+            yield sse_event("error", {"detail": f"Chat failed: {str(e)}"})
+
+    # No caching or proxy buffering, so each event reaches the client as it is sent
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
 @router.get("/conversations", response_model=ConversationListResponse, tags=["Conversations"])
 async def get_all_conversations():
     """Get all conversations with their metadata"""
@@ -185,6 +278,30 @@ async def delete_conversation(thread_id: str):
         logger.error(f"Delete conversation error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to delete conversation: {str(e)}")
 
+@router.get("/conversations/{thread_id}/title", response_model=ConversationTitleResponse, tags=["Conversations"])
+async def get_conversation_title(thread_id: str):
+    """Current title of a conversation, with status "pending" until the generated title has replaced the provisional one"""
+    logger.info(f"=== Get Conversation Title: {thread_id} ===")
+    
+    try:
+        if not agent:
+            logger.error("Agent not initialized")
+            raise Exception("Agent not initialized")
+        
+        title = agent.get_conversation_title(thread_id)
+        
+        if not title:
+            logger.warning(f"Conversation not found: {thread_id}")
+            raise HTTPException(status_code=404, detail=f"Conversation not found: {thread_id}")
+        
+        return ConversationTitleResponse(**title)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get conversation title error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to get conversation title: {str(e)}")
+
 @router.put("/conversations/{thread_id}/title", tags=["Conversations"])
 async def update_conversation_title(thread_id: str, title: str):
     """Update the title of a conversation"""
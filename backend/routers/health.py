@@ -1,4 +1,5 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 import sys
 import os
 
@@ -15,6 +16,7 @@ router = APIRouter()
 # Global instances
 kb = None
 agent = None
+startup = None
 
 def set_instances(kb_instance, agent_instance):
     """Set the global instances"""
@@ -22,17 +24,44 @@ def set_instances(kb_instance, agent_instance):
     kb = kb_instance
     agent = agent_instance
 
+def set_startup_tracker(tracker):
+    """Set the tracker that records startup phases"""
+    global startup
+    startup = tracker
+
 @router.get("/", tags=["Health"])
 async def root():
     return {"message": "Agentic AI Assistant API is running"}
 
+@router.get("/health/live", tags=["Health"])
+async def liveness():
+    """The process is up and serving requests, whether or not startup has finished"""
+    report = startup.report() if startup else {"phases": {}}
+    return {"status": "alive", "uptime_seconds": report.get("uptime_seconds"), "phases": report["phases"]}
+
+@router.get("/health/ready", tags=["Health"])
+async def readiness():
+    """503 until the query path is up; reports each startup phase and its duration"""
+    if not startup:
+        return JSONResponse(status_code=503, content={"status": "starting", "ready": False, "phases": {}})
+    report = startup.report()
+    report["status"] = "ready" if report["ready"] else "starting"
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@router.get("/metrics", tags=["Health"])
+async def get_metrics():
+    """Query-path performance metrics (batching, caches)"""
+    if not agent:
+        return JSONResponse(status_code=503, content={"detail": "Agent not initialized"})
+    return agent.get_metrics()
+
 @router.get("/health", response_model=HealthResponse, tags=["Health"])
 async def health_check():
     """Check the health of all services"""
     logger.info("Health check requested")
     try:
-        # Check Pinecone connection
-        pinecone_status = kb.index.describe_index_stats() if kb else False
+        # Check vector store connection
+        pinecone_status = kb.vector_store.stats() if kb else False
         logger.info(f"Pinecone status: {bool(pinecone_status)}")
         
         # Check Azure AI Agent connection
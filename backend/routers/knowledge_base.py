@@ -8,53 +8,60 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from core.config import *
 from core.logger import setup_logger
 from services.knowledge_base import KnowledgeBase
-from models.schemas import IngestResponse
+from models.schemas import IngestJobResponse
 
 logger = setup_logger('knowledge_base_router')
 router = APIRouter()
 
 # Global knowledge base instance
 kb = None
+ingestion_jobs = None
 
 def set_kb_instance(kb_instance):
     """Set the global knowledge base instance"""
     global kb
     kb = kb_instance
 
-@router.post("/ingest", response_model=IngestResponse, tags=["Knowledge Base"])
-async def ingest_documents():
-    """Ingest documents from Confluence into Pinecone"""
+def set_ingestion_jobs(job_manager):
+    """Set the global ingestion job manager"""
+    global ingestion_jobs
+    ingestion_jobs = job_manager
+
+@router.post("/ingest", response_model=IngestJobResponse, status_code=202, tags=["Knowledge Base"])
+async def ingest_documents(force: bool = False):
+    """
+    Start ingesting documents from Confluence into the vector store in the background.
+    Returns the job at once; if an ingestion is already running, that job is returned instead.
+    """
+    if not ingestion_jobs:
+        raise HTTPException(status_code=503, detail="Ingestion not initialized")
     try:
-        if not kb:
-            raise Exception("Knowledge base not initialized")
-        
-        # Run the pipeline
-        kb.run_pipeline()
-        
-        # Get statistics
-        total_docs = len(kb.documents)
-        total_chunks = sum(len(kb.chunk_text(doc['content'])) for doc in kb.documents)
-        
-        return IngestResponse(
-            message="Documents ingested successfully",
-            documents_processed=total_docs,
-            chunks_uploaded=total_chunks
-        )
+        return IngestJobResponse(**ingestion_jobs.start(force=force))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to start ingestion: {str(e)}")
+
+@router.get("/ingest/{job_id}", response_model=IngestJobResponse, tags=["Knowledge Base"])
+async def get_ingestion_job(job_id: str):
+    """Status of an ingestion job with per-stage progress and throughput"""
+    if not ingestion_jobs:
+        raise HTTPException(status_code=503, detail="Ingestion not initialized")
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return IngestJobResponse(**job)
 
 @router.get("/stats", tags=["Knowledge Base"])
 async def get_index_stats():
-    """Get statistics about the Pinecone index"""
+    """Get statistics about the vector index"""
     try:
         if not kb:
             raise Exception("Knowledge base not initialized")
         
-        stats = kb.index.describe_index_stats()
+        stats = kb.vector_store.stats()
         return {
-            "total_vector_count": stats.get('total_vector_count', 0),
-            "dimension": stats.get('dimension', 0),
-            "index_fullness": stats.get('index_fullness', 0)
+            "total_vector_count": stats['total_vector_count'],
+            "dimension": stats['dimension'],
+            "index_fullness": stats['index_fullness']
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
@@ -0,0 +1,107 @@
+import sys
+import os
+
+# Add the project root to the python path so imports work correctly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import numpy as np
+from core.config import *
+from core.embeddings import OnnxEmbedder, model_repo_id, resolve_model_dir
+
+# Representative inputs for the agreement check: short queries and longer passages
+SAMPLE_TEXTS = [
+    "How do I reset my VPN password?",
+    "What is the escalation process for a P1 incident?",
+    "Steps to request access to the production database",
+    "jira ticket for laptop replacement",
+    "The onboarding checklist covers hardware, accounts and mandatory trainings. "
+    "New joiners should complete the security awareness course within their first week.",
+    "To deploy a hotfix, create a branch from the release tag, open a pull request and "
+    "ask the on-call engineer to approve the change before merging.",
+    "Expense reports must be submitted before the fifth working day of the following month, "
+    "with receipts attached for every item above the per-diem limit.",
+    "Error 503: the service is temporarily unavailable. Retry after a few minutes or contact support.",
+]
+
+
+def export_onnx(st_model, onnx_path):
+    """Export the transformer of a SentenceTransformer; pooling is done by OnnxEmbedder"""
+    import torch
+
+    transformer = st_model[0].auto_model.eval()
+    dummy = st_model.tokenizer(["An example sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    print(f"Exported ONNX model to {onnx_path}")
+
+
+def quantize_onnx(onnx_path, quantized_path):
+    """int8 dynamic quantization: weights stored as int8, activations quantized at run time"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    size_mb = os.path.getsize(quantized_path) / (1024 * 1024)
+    print(f"Quantized model written to {quantized_path} ({size_mb:.1f} MB)")
+
+
+def check_agreement(st_model, onnx_model, texts, threshold):
+    """Cosine similarity between PyTorch and ONNX vectors for the same texts"""
+    reference = np.asarray(st_model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    candidate = np.asarray(onnx_model.encode(texts), dtype=np.float32)
+    candidate = candidate / np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    cosines = (reference * candidate).sum(axis=1)
+
+    print(f"Cosine agreement over {len(texts)} texts: min={cosines.min():.4f} mean={cosines.mean():.4f}")
+    if cosines.min() < threshold:
+        worst = int(cosines.argmin())
+        print(f"FAILED: below threshold {threshold} for: {texts[worst][:80]!r}")
+        return False
+    print(f"OK: all texts above threshold {threshold}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX, quantize it to int8 and check it against PyTorch")
+    parser.add_argument("--model-dir", default=None, help="Local model directory (default: EMBEDDING_MODEL_PATH or models_cache)")
+    parser.add_argument("--output", default=EMBEDDING_ONNX_FILE, help="Quantized model path, relative to the model directory")
+    parser.add_argument("--threshold", type=float, default=0.99, help="Minimum cosine similarity to the PyTorch vectors")
+    parser.add_argument("--texts-file", default=None, help="Extra texts for the agreement check, one per line")
+    parser.add_argument("--check-only", action="store_true", help="Only run the agreement check on an existing export")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = args.model_dir or resolve_model_dir(model_repo_id())
+    quantized_path = os.path.join(model_dir, args.output)
+    st_model = SentenceTransformer(model_dir)
+
+    if not args.check_only:
+        onnx_path = os.path.join(os.path.dirname(quantized_path), "model_fp32.onnx")
+        export_onnx(st_model, onnx_path)
+        quantize_onnx(onnx_path, quantized_path)
+
+    texts = list(SAMPLE_TEXTS)
+    if args.texts_file:
+        with open(args.texts_file, "r", encoding="utf-8") as f:
+            texts.extend(line.strip() for line in f if line.strip())
+
+    onnx_model = OnnxEmbedder(model_dir, quantized_path, threads=EMBEDDING_ONNX_THREADS)
+    if not check_agreement(st_model, onnx_model, texts, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
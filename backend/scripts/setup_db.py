@@ -4,11 +4,12 @@ import os
 # Add the project root to the python path so imports work correctly
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from pinecone import Pinecone, ServerlessSpec
 import time
 from core.config import *
+from core.vector_store import get_vector_store
 
 def setup_pinecone():
+    from pinecone import Pinecone, ServerlessSpec
     print("Initializing Pinecone...")
     pc = Pinecone(api_key=PINECONE_API_KEY)
 
@@ -21,10 +22,10 @@ def setup_pinecone():
         return pc.Index(INDEX_NAME)
 
     print(f"Creating new index: {INDEX_NAME}...")
-    # Standard Index for 384-dimension vectors (all-MiniLM-L6-v2)
+    # Standard Index sized for the embedding model (384 dimensions for all-MiniLM-L6-v2)
     pc.create_index(
         name=INDEX_NAME,
-        dimension=384, 
+        dimension=VECTOR_DIMENSION, 
         metric="cosine",
         spec=ServerlessSpec(
             cloud="aws",
@@ -38,5 +39,15 @@ def setup_pinecone():
 
     return pc.Index(INDEX_NAME)
 
+def setup_vector_store():
+    """Create the Pinecone index if needed, then open the configured vector store"""
+    if VECTOR_STORE == "pinecone":
+        setup_pinecone()
+    else:
+        print(f"Using local vector store at {LOCAL_VECTOR_STORE_DIR}")
+    store = get_vector_store()
+    print(f"Vector store ready: {store.stats()['total_vector_count']} vectors")
+    return store
+
 if __name__ == "__main__":
-    setup_pinecone()
+    setup_vector_store()
@@ -1,56 +1,67 @@
-from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
 from azure.identity import ClientSecretCredential
+from azure.identity.aio import ClientSecretCredential as AsyncClientSecretCredential
 from azure.ai.projects import AIProjectClient
+from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
+from azure.ai.agents.models import AsyncAgentEventHandler, ListSortOrder, MessageDeltaChunk, ThreadRun
+import asyncio
 import textwrap
 import time
 import os
 import sys
 import json
+import uuid
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from core.config import *
 from core.logger import setup_logger
+from core.embeddings import get_embedding_model, lowercases_input
+from core.vector_store import get_vector_store, matches_filter
+from core.bm25 import get_bm25_index, reciprocal_rank_fusion
 from services.jira_tool import JiraTicketTool
+from services.embedding_service import EmbeddingService
+from services.retrieval_cache import RetrievalCache
+from services.answer_cache import SemanticAnswerCache
+from services.reranker import Reranker
+from services.context_packer import ContextPacker
+from services.title_jobs import TitleJobs, extractive_title
+from services.prompts import AnswerTextStream, PromptAccounting, format_turn, merge_instructions, TITLE_INSTRUCTIONS
+from core.index_state import index_generation
 
 logger = setup_logger('agent')
 
+RUN_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
+
+def poll_intervals(initial_ms=AZURE_POLL_INITIAL_MS, max_ms=AZURE_POLL_MAX_MS, backoff=AZURE_POLL_BACKOFF):
+    """Seconds to wait between run status polls: short at first, growing by `backoff` up to max_ms"""
+    interval = initial_ms
+    while True:
+        yield interval / 1000
+        interval = min(interval * backoff, max_ms)
+
 class Agent:
     def __init__(self):
         logger.info("Initializing Agent...")
         
-        # 1. Initialize Pinecone
-        logger.info("Connecting to Pinecone...")
+        # 1. Initialize the vector store
+        logger.info(f"Connecting to vector store ({VECTOR_STORE})...")
         try:
-            self.pc = Pinecone(api_key=PINECONE_API_KEY)
-            self.index = self.pc.Index(INDEX_NAME)
-            logger.info(f"Successfully connected to Pinecone index: {INDEX_NAME}")
+            self.vector_store = get_vector_store()
+            logger.info(f"Successfully connected to vector store: {VECTOR_STORE}")
         except Exception as e:
-            logger.error(f"Failed to connect to Pinecone: {e}", exc_info=True)
+            logger.error(f"Failed to connect to vector store: {e}", exc_info=True)
             raise
         
         # 2. Initialize Embedding Model (Local)
         logger.info("Loading embedding model...")
         print("Loading embedding model...")
         try:
-            # Try using huggingface_hub directly to download
-            from huggingface_hub import hf_hub_download, snapshot_download
-            cache_dir = "./models_cache"
-            os.makedirs(cache_dir, exist_ok=True)
-            
-            # Download the model snapshot first
-            model_path = snapshot_download(
-                repo_id="sentence-transformers/all-MiniLM-L6-v2",
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-            print(f"Model downloaded to: {model_path}")
-            
-            # Now load the model from the local path
-            self.embed_model = SentenceTransformer(model_path)
-            logger.info(f"Embedding model loaded successfully from: {model_path}")
+            # Shared with the knowledge bases, so the model is loaded once per process
+            self.embed_model = get_embedding_model()
             print("Model loaded successfully!")
             
         except Exception as e:
@@ -88,6 +99,47 @@ class Agent:
             
             self.embed_model = SimpleEmbedder()
             logger.info("Fallback TF-IDF embedder initialized")
+
+        # Batch concurrent query embeddings; the TF-IDF fallback is fitted on its first call, so it isn't batched
+        self.query_embedder = None
+        if EMBED_BATCHING_ENABLED and getattr(self.embed_model, "registry_id", None):
+            self.query_embedder = EmbeddingService(self.embed_model)
+            logger.info(f"Query embedding batching enabled (max {EMBED_BATCH_MAX_SIZE}, {EMBED_BATCH_MAX_WAIT_MS}ms)")
+
+        # The fitted-on-first-call TF-IDF fallback has no stable vectors to cache
+        self.retrieval_cache = None
+        if QUERY_CACHE_ENABLED and getattr(self.embed_model, "registry_id", None):
+            self.retrieval_cache = RetrievalCache(lowercase=lowercases_input(self.embed_model))
+
+        # Answers to first-turn questions, reused for near-duplicate questions with the same sources
+        self.answer_cache = None
+        if ANSWER_CACHE_ENABLED and getattr(self.embed_model, "registry_id", None):
+            self.answer_cache = SemanticAnswerCache()
+
+        # Keyword index built by the ingestion pipeline, searched alongside the vectors
+        self.bm25 = None
+        if HYBRID_SEARCH_ENABLED:
+            try:
+                self.bm25 = get_bm25_index()
+                self._search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25-search")
+                logger.info(f"Hybrid search enabled: {self.bm25.stats()}")
+            except Exception as e:
+                logger.warning(f"BM25 index unavailable, using vector search only: {e}")
+                self.bm25 = None
+
+        # Cross-encoder rerank of retrieved chunks; without it the top_k vector matches go to the prompt
+        self.reranker = None
+        if RERANK_ENABLED:
+            try:
+                self.reranker = Reranker()
+            except Exception as e:
+                logger.warning(f"Reranker unavailable, using retrieval order: {e}")
+
+        # Packs retrieved chunks into the prompt's token budget, counting with the embedding model's tokenizer
+        self.context_packer = None
+        if CONTEXT_PACKING_ENABLED:
+            self.context_packer = ContextPacker(tokenizer=getattr(self.embed_model, "tokenizer", None))
+            logger.info(f"Context packing enabled ({CONTEXT_MAX_TOKENS} token budget)")
         
         # 3. Initialize Azure AI Projects Client
         logger.info("Initializing Azure AI Projects Client...")
@@ -106,6 +158,19 @@ class Agent:
                 endpoint=PROJECT_ENDPOINT
             )
             logger.info(f"Azure AI Project Client initialized with endpoint: {PROJECT_ENDPOINT}")
+
+            # Async client for the API's answer path; its HTTP session opens on first use in the event loop
+            self.acredential = AsyncClientSecretCredential(
+                tenant_id=TENANT_ID,
+                client_id=CLIENT_ID,
+                client_secret=CLIENT_SECRET
+            )
+            self.aproject = AsyncAIProjectClient(
+                credential=self.acredential,
+                endpoint=PROJECT_ENDPOINT
+            )
+            # Runs in flight at once on the async client
+            self._run_slots = asyncio.Semaphore(AZURE_MAX_CONCURRENT_RUNS)
             
             self.agent_id = AZURE_AGENT_ID
             logger.info(f"Using Agent ID: {self.agent_id}")
@@ -117,56 +182,147 @@ class Agent:
         
         # Initialize conversation storage (in-memory for now)
         self.conversations: Dict[str, Dict] = {}
+        # Generated titles replace the extractive ones in the background
+        self.title_jobs = TitleJobs(self.agenerate_conversation_title, self._apply_generated_title)
         logger.info("Conversation storage initialized")
 
         # 4. Initialize Tools
+        tools = None
         try:
             self.jira_tool = JiraTicketTool()
-            tool_def = self.jira_tool.get_tool_definition()
-            
-            # Update the existing agent with Jira tools
-            logger.info(f"Updating existing Agent {self.agent_id} with Jira tools...")
-            try:
-                updated_agent = self.project.agents.update_agent(
-                    agent_id=self.agent_id,
-                    tools=[tool_def]
-                )
-                logger.info(f"Successfully updated agent {self.agent_id} with Jira tools")
-            except Exception as update_error:
-                logger.warning(f"Failed to update agent with tools: {update_error}")
-                logger.info("Agent will work without Jira tool integration")
-
-            
+            tools = [self.jira_tool.get_tool_definition()]
         except Exception as e:
             logger.warning(f"Failed to initialize Jira tool: {e}")
+
+        # 5. Register the static answer instructions and the tools with the existing agent
+        counter = self.context_packer.count_tokens if self.context_packer else None
+        self.prompt_accounting = PromptAccounting(count_tokens=counter)
+        logger.info(f"Updating existing Agent {self.agent_id} with answer instructions{' and Jira tools' if tools else ''}...")
+        try:
+            current = self.project.agents.get_agent(self.agent_id)
+            update = {"instructions": merge_instructions(getattr(current, "instructions", None))}
+            if tools:
+                update["tools"] = tools
+            self.project.agents.update_agent(agent_id=self.agent_id, **update)
+            self.prompt_accounting.instructions_registered = True
+            logger.info(f"Successfully updated agent {self.agent_id}")
+        except Exception as update_error:
+            logger.warning(f"Failed to update agent: {update_error}")
+            logger.info("Answer instructions will be sent with every message")
+            if tools:
+                # Tools alone, as before
+                try:
+                    self.project.agents.update_agent(agent_id=self.agent_id, tools=tools)
+                except Exception as tools_error:
+                    logger.warning(f"Failed to update agent with tools: {tools_error}")
+                    logger.info("Agent will work without Jira tool integration")
     
-    def search_knowledge_base(self, query, top_k=10):
+    def embed_query(self, query) -> List[float]:
+        """
+        Query vector, from the vector cache when this question was seen before
+        """
+        query_vector = self.retrieval_cache.get_vector(query) if self.retrieval_cache else None
+        if query_vector is not None:
+            logger.debug("Query vector served from cache")
+            return query_vector
+        if self.query_embedder:
+            query_vector = self.query_embedder.encode(query).tolist()
+        else:
+            query_vector = self.embed_model.encode(query).tolist()
+        if self.retrieval_cache:
+            self.retrieval_cache.put_vector(query, query_vector)
+        return query_vector
+
+    def search_knowledge_base(self, query, top_k=10, filters: Optional[Dict] = None):
         """
-        Searches Pinecone for the most relevant chunks of text.
+        Searches the vector store for the most relevant chunks of text.
+        Repeated questions are served from the query caches.
         """
         logger.info(f"Searching knowledge base for query: '{query}' (top_k={top_k})")
         try:
             # Convert query to vector
-            query_vector = self.embed_model.encode(query).tolist()
+            query_vector = self.embed_query(query)
             logger.debug(f"Query vector generated with dimension: {len(query_vector)}")
-            
-            # Search Pinecone
-            results = self.index.query(
-                vector=query_vector,
-                top_k=top_k,
-                include_metadata=True
-            )
-            
-            matches = results['matches']
-            logger.info(f"Found {len(matches)} matches from Pinecone")
+
+            results_key = None
+            if self.retrieval_cache:
+                results_key = self.retrieval_cache.results_key(query_vector, top_k, filters)
+                matches = self.retrieval_cache.get_matches(results_key)
+                if matches is not None:
+                    logger.info(f"Found {len(matches)} matches in retrieval cache")
+                    return matches
+
+            if self.bm25:
+                matches = self._hybrid_search(query, query_vector, top_k, filters)
+            else:
+                # Search the vector store
+                results = self.vector_store.query(
+                    vector=query_vector,
+                    top_k=top_k,
+                    include_metadata=True,
+                    filter=filters
+                )
+                matches = results['matches']
+            logger.info(f"Found {len(matches)} matches from {VECTOR_STORE}{' + BM25' if self.bm25 else ''}")
             for i, match in enumerate(matches):
                 logger.debug(f"Match {i+1}: Score={match.get('score', 'N/A')}, Source={match.get('metadata', {}).get('source', 'Unknown')}")
-            
+
+            if results_key is not None:
+                self.retrieval_cache.put_matches(results_key, matches)
             return matches
         except Exception as e:
             logger.error(f"Error searching knowledge base: {e}", exc_info=True)
             raise
 
+    def _hybrid_search(self, query, query_vector, top_k, filters: Optional[Dict] = None):
+        """
+        Run BM25 and vector search in parallel and fuse the two rankings with
+        reciprocal-rank fusion. Each match keeps its cosine score as `score`
+        (keyword-only hits are scored against their stored vector) and gets
+        its fused score as `fusion_score`; BM25 hits are flagged `keyword_match`.
+        """
+        candidates = max(top_k, HYBRID_CANDIDATES)
+        keyword_future = self._search_pool.submit(self.bm25.search, query, candidates)
+        vector_matches = self.vector_store.query(
+            vector=query_vector,
+            top_k=candidates,
+            include_metadata=True,
+            filter=filters
+        )['matches']
+        try:
+            keyword_hits = keyword_future.result()
+        except Exception as e:
+            logger.warning(f"BM25 search failed, using vector results only: {e}")
+            keyword_hits = []
+
+        by_id = {match['id']: match for match in vector_matches}
+        missing = [vector_id for vector_id, _ in keyword_hits if vector_id not in by_id]
+        if missing:
+            query_unit = np.asarray(query_vector, dtype=np.float32)
+            query_unit /= np.linalg.norm(query_unit) or 1.0
+            for vector_id, record in self.vector_store.fetch(missing).items():
+                if filters and not matches_filter(record['metadata'], filters):
+                    continue
+                values = np.asarray(record['values'], dtype=np.float32)
+                by_id[vector_id] = {
+                    "id": vector_id,
+                    "score": float(values @ query_unit / (np.linalg.norm(values) or 1.0)),
+                    "metadata": record['metadata']
+                }
+        # Keyword hits whose vectors are gone (or filtered out) drop out of the ranking
+        keyword_ranking = [vector_id for vector_id, _ in keyword_hits if vector_id in by_id]
+        vector_ranking = [match['id'] for match in vector_matches]
+        logger.debug(f"Fusing {len(vector_ranking)} vector and {len(keyword_ranking)} keyword candidates")
+
+        keyword_ids = set(keyword_ranking)
+        matches = []
+        for vector_id, fusion_score in reciprocal_rank_fusion([vector_ranking, keyword_ranking], k=RRF_K)[:top_k]:
+            match = dict(by_id[vector_id])
+            match['fusion_score'] = fusion_score
+            match['keyword_match'] = vector_id in keyword_ids
+            matches.append(match)
+        return matches
+
     def generate_conversation_title(self, first_message: str) -> str:
         """
         Generate a conversation title based on the first user message using the Azure agent
@@ -175,178 +331,338 @@ class Agent:
         try:
             # Create a temporary thread for title generation
             thread = self.project.agents.threads.create()
-            
-            # Create a prompt for title generation
-            title_prompt = f"""Generate a short, concise title (maximum 5-7 words) for a conversation that starts with this question:
-
-"{first_message}"
 
-Respond with ONLY the title, nothing else. No quotes, no explanations."""
-            
             self.project.agents.messages.create(
                 thread_id=thread.id,
                 role="user",
-                content=title_prompt
+                content=self._title_prompt(first_message)
             )
-            
-            # Run the agent
+
+            # Run the agent, without its answer instructions (they ask for JSON)
             run = self.project.agents.runs.create_and_process(
                 thread_id=thread.id,
-                agent_id=self.agent_id
+                agent_id=self.agent_id,
+                instructions=TITLE_INSTRUCTIONS
             )
-            
+
             # Poll for completion
-            poll_count = 0
-            while poll_count < 30:  # Max 30 seconds
-                poll_count += 1
+            deadline = time.monotonic() + TITLE_TIMEOUT_SECONDS
+            intervals = poll_intervals()
+            while True:
                 response = self.project.agents.runs.get(
                     thread_id=thread.id,
                     run_id=run.id
                 )
-                if response.status in ("completed", "failed", "cancelled", "expired"):
+                if response.status in RUN_TERMINAL_STATUSES or time.monotonic() >= deadline:
                     break
-                time.sleep(1)
-            
+                time.sleep(next(intervals))
+
             # Get the title if completed
+            title = None
             if response.status == "completed":
-                messages = list(self.project.agents.messages.list(thread_id=thread.id))
-                for msg in messages:
-                    if msg.role == "assistant":
-                        title = msg.content[0].text.value.strip()
-                        # Remove quotes if present
-                        title = title.strip('"').strip("'")
-                        logger.info(f"Generated title: '{title}'")
-                        return title
-            
-            # Fallback to a default title
-            fallback_title = f"Chat about {first_message[:30]}..."
-            logger.warning(f"Using fallback title: '{fallback_title}'")
-            return fallback_title
-            
+                reply = self._run_reply(thread.id, run.id)
+                if reply is not None:
+                    title = self._clean_title(reply)
+
+            # The temporary thread is not part of any conversation
+            try:
+                self.project.agents.threads.delete(thread.id)
+            except Exception as e:
+                logger.warning(f"Failed to delete title thread {thread.id}: {e}")
+
+            return title or self._fallback_title(first_message)
+
         except Exception as e:
             logger.error(f"Error generating conversation title: {e}", exc_info=True)
             return f"New Conversation"
 
+    async def agenerate_conversation_title(self, first_message: str) -> Optional[str]:
+        """
+        generate_conversation_title on the async client, for the background
+        title jobs: waiting for the run doesn't hold up the event loop. Returns
+        None if the run times out or doesn't complete, and raises on errors, so
+        the conversation keeps its extractive title instead of a fallback.
+        """
+        logger.info(f"Generating conversation title for message: '{first_message[:50]}...'")
+        agents = self.aproject.agents
+        title = None
+        async with self._run_slots:
+            thread = await agents.threads.create()
+            try:
+                await agents.messages.create(
+                    thread_id=thread.id,
+                    role="user",
+                    content=self._title_prompt(first_message)
+                )
+                run = await agents.runs.create(
+                    thread_id=thread.id,
+                    agent_id=self.agent_id,
+                    instructions=TITLE_INSTRUCTIONS
+                )
+                try:
+                    response = await asyncio.wait_for(
+                        self._await_run(thread.id, run.id, handle_tool_calls=False),
+                        timeout=TITLE_TIMEOUT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"Title generation timed out after {TITLE_TIMEOUT_SECONDS}s")
+                    response = None
+
+                if response is not None and response.status == "completed":
+                    reply = await self._arun_reply(thread.id, run.id)
+                    if reply is not None:
+                        title = self._clean_title(reply)
+            finally:
+                # The temporary thread is not part of any conversation
+                try:
+                    await agents.threads.delete(thread.id)
+                except Exception as e:
+                    logger.warning(f"Failed to delete title thread {thread.id}: {e}")
+
+        return title or None
+
+    @staticmethod
+    def _title_prompt(first_message: str) -> str:
+        return f"""Generate a short, concise title (maximum 5-7 words) for a conversation that starts with this question:
+
+"{first_message}"
+
+Respond with ONLY the title, nothing else. No quotes, no explanations."""
+
+    @staticmethod
+    def _clean_title(raw_title: str) -> str:
+        # Remove quotes if present
+        title = raw_title.strip().strip('"').strip("'")
+        logger.info(f"Generated title: '{title}'")
+        return title
+
+    @staticmethod
+    def _fallback_title(first_message: str) -> str:
+        fallback_title = f"Chat about {first_message[:30]}..."
+        logger.warning(f"Using fallback title: '{fallback_title}'")
+        return fallback_title
+
+    def _context_text(self, matches):
+        """Context blocks for the matches, and the numbered context of the prompt built from them"""
+        # Block i resolves to the matches it was built from
+        context_blocks = self.build_context(matches)
+        context_text = ""
+        for i, block in enumerate(context_blocks):
+            context_text += f"\n[{i}] Source: {block['source']}\nContent: {block['text']}\n"
+            logger.debug(f"Context {i}: {block['source']} - {block['text'][:100]}...")
+        return context_blocks, context_text
+
+    def _start_conversation(self, thread_id: str):
+        logger.info(f"Thread created: {thread_id}")
+        print(f"Thread created: {thread_id}")
+        self.conversations[thread_id] = {
+            "thread_id": thread_id,
+            "title": None,  # Will be set later
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+            "messages": []
+        }
+
+    def _turn_message(self, query, context_text):
+        # The static rules live in the agent's instructions; the message carries only this turn
+        user_message = format_turn(context_text, query, inline_instructions=not self.prompt_accounting.instructions_registered)
+        self.prompt_accounting.record(user_message)
+        logger.debug(f"User message prepared (length: {len(user_message)} chars)")
+        return user_message
+
+    def _run_tool_call(self, tool_call) -> Optional[Dict]:
+        """Execute one tool call of a run; returns its tool output, or None for unknown tools"""
+        logger.info(f"Tool call detected: {tool_call.function.name}")
+        print(f"Calling tool: {tool_call.function.name}")
+        if tool_call.function.name != "create_ticket":
+            return None
+
+        logger.info(f"Executing tool: {tool_call.function.name}")
+        logger.info(f"Tool arguments: {tool_call.function.arguments}")
+        try:
+            args = json.loads(tool_call.function.arguments)
+            logger.info(f"Parsed args: {args}")
+            result = self.jira_tool.create_ticket(**args)
+            output_str = json.dumps(result)
+            logger.info(f"Tool executed. Result: {output_str}")
+            print(f"✅ Ticket created: {result}")
+        except Exception as e:
+            logger.error(f"Tool execution failed: {e}", exc_info=True)
+            output_str = json.dumps({"status": False, "error": str(e)})
+        return {
+            "tool_call_id": tool_call.id,
+            "output": output_str
+        }
+
+    def _run_reply(self, thread_id: str, run_id: str) -> Optional[str]:
+        """
+        Text of the newest assistant message the run created, or None. Only
+        that one message is requested, so the cost doesn't grow with the thread.
+        """
+        messages = self.project.agents.messages.list(
+            thread_id=thread_id, run_id=run_id, order=ListSortOrder.DESCENDING, limit=1
+        )
+        for msg in messages:
+            if msg.role == "assistant":
+                return msg.content[0].text.value
+            break
+        return None
+
+    async def _arun_reply(self, thread_id: str, run_id: str) -> Optional[str]:
+        """_run_reply on the async client"""
+        messages = self.aproject.agents.messages.list(
+            thread_id=thread_id, run_id=run_id, order=ListSortOrder.DESCENDING, limit=1
+        )
+        async for msg in messages:
+            if msg.role == "assistant":
+                return msg.content[0].text.value
+            break
+        return None
+
+    @staticmethod
+    def _log_run_finished(response):
+        status = response.status
+        logger.info(f"Run finished with status: {status}")
+        if status == "failed":
+            logger.error(f"Run failed details: {getattr(response, 'last_error', 'No last_error found')}")
+            # Also protectively log the whole response if possible
+            try:
+                logger.error(f"Run response dump: {response}")
+            except:
+                pass
+
+    @staticmethod
+    def _parse_reply(raw_content, context_blocks):
+        """
+        Answer text, the matches it used and whether the reply was valid JSON,
+        from the assistant's raw reply
+        """
+        raw_content = raw_content.strip()
+
+        # Clean up markdown code blocks if present
+        if raw_content.startswith("```json"):
+            raw_content = raw_content[7:]
+        if raw_content.startswith("```"):
+            raw_content = raw_content[3:]
+        if raw_content.endswith("```"):
+            raw_content = raw_content[:-3]
+
+        raw_content = raw_content.strip()
+
+        used_matches = []
+        answer = raw_content
+        parsed_ok = False
+
+        try:
+            parsed = json.loads(raw_content)
+            answer = parsed.get("answer", raw_content)
+            indices = parsed.get("used_source_indices", [])
+
+            # Filter matches based on indices
+            for idx in indices:
+                if isinstance(idx, int) and 0 <= idx < len(context_blocks):
+                    for match in context_blocks[idx]["matches"]:
+                        if match not in used_matches:
+                            used_matches.append(match)
+
+            parsed_ok = True
+            logger.info(f"Successfully parsed structured response. Used {len(used_matches)} sources.")
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse JSON response, falling back to raw text and all sources.")
+            # Fallback: keep raw answer, assume NO sources clearly identified (or could assume ALL)
+            # User requested specific sources. If we can't parse, it's safer to return none or all.
+            # Let's return the matches sent as context to maintain legacy behavior on failure to parse
+            used_matches = [match for block in context_blocks for match in block["matches"]]
+
+        logger.info(f"Assistant response received (length: {len(answer)} chars)")
+        logger.debug(f"Assistant response: {answer[:200]}...")
+        return answer, used_matches, parsed_ok
+
+    def _record_turn(self, conversation_id, query, answer, used_matches):
+        """Store the conversation"""
+        if conversation_id not in self.conversations:
+            return
+        # Add user message
+        self.conversations[conversation_id]["messages"].append({
+            "role": "user",
+            "content": query,
+            "timestamp": datetime.now().isoformat(),
+            "sources": None
+        })
+
+        # Add assistant message
+        sources_info = [{
+            "source": match['metadata']['source'],
+            "chunk_text": match['metadata']['chunk_text'][:200] + "...",
+            "chunk_index": match['metadata']['chunk_index']
+        } for match in used_matches]
+
+        self.conversations[conversation_id]["messages"].append({
+            "role": "assistant",
+            "content": answer,
+            "timestamp": datetime.now().isoformat(),
+            "sources": sources_info
+        })
+
+        # Update timestamp
+        self.conversations[conversation_id]["updated_at"] = datetime.now().isoformat()
+
+        logger.info(f"Conversation updated: {conversation_id}")
+
+    def _cache_answer(self, conversation_id, query, query_vector, matches, answer, used_matches, generation):
+        cache_key = self.answer_cache.put(query_vector, matches, answer, used_matches, generation)
+        if cache_key and conversation_id in self.conversations:
+            self.conversations[conversation_id]["answer_cache_key"] = cache_key
+
     def generate_answer(self, query, matches, thread_id: Optional[str] = None):
         """
         Generate answer using Azure AI Foundry Agent based on retrieved context
         """
         logger.info(f"Generating answer for query: '{query}'")
         try:
+            # Index generation the matches were retrieved at, for the answer cache
+            generation = index_generation()
+            tools_called = False
+
             # Prepare context string with indices
-            context_text = ""
-            for i, match in enumerate(matches):
-                source = match['metadata']['source']
-                text = match['metadata']['chunk_text']
-                context_text += f"\n[{i}] Source: {source}\nContent: {text}\n"
-                logger.debug(f"Context {i}: {source} - {text[:100]}...")
+            context_blocks, context_text = self._context_text(matches)
 
             # Use existing thread or create a new one
-            if thread_id and thread_id in self.conversations:
+            first_turn = not (thread_id and thread_id in self.conversations)
+            if not first_turn:
                 logger.info(f"Using existing thread: {thread_id}")
                 print(f"Using existing thread: {thread_id}")
-                # Retrieve the thread object (we'll use the stored thread_id)
-                class ThreadObj:
-                    def __init__(self, tid):
-                        self.id = tid
-                thread = ThreadObj(thread_id)
+                conversation_id = thread_id
+                azure_thread_id = self.conversations[thread_id].get("azure_thread_id", thread_id)
+                if azure_thread_id is None:
+                    # Conversation started from the answer cache: create its thread now
+                    azure_thread_id = self._create_thread_with_history(thread_id)
             else:
                 logger.info("Creating new Azure thread...")
-                thread = self.project.agents.threads.create()
-                logger.info(f"Thread created: {thread.id}")
-                print(f"Thread created: {thread.id}")
-                
+                azure_thread_id = self.project.agents.threads.create().id
+                conversation_id = azure_thread_id
                 # Initialize conversation storage
-                self.conversations[thread.id] = {
-                    "thread_id": thread.id,
-                    "title": None,  # Will be set later
-                    "created_at": datetime.now().isoformat(),
-                    "updated_at": datetime.now().isoformat(),
-                    "messages": []
-                }
-            
-            # Add user message with context and JSON instructions
-            user_message = f"""Use the following context from the company's documentation to answer the user's question.
-
-CRITICAL INSTRUCTION FOR JIRA TICKETS:
-You have access to a 'create_ticket' tool that creates Jira tickets.
-
-WHEN TO CREATE TICKETS:
-
-1. **User Explicitly Requests a Ticket:**
-   - If the user says "create a ticket", "raise a ticket", "I want to raise a ticket", etc.
-   - FIRST ask: "I'd be happy to create a ticket for you. Could you please provide:
-     - A brief summary of the issue
-     - A detailed description of what you're experiencing"
-   - WAIT for the user to provide this information
-   - ONLY create the ticket after you have both summary and description from the user
-   - DO NOT create a ticket without getting this information first
-
-2. **After Attempting to Help (Automatic Creation):**
-   - If you already provided troubleshooting steps or suggestions from the documentation
-   - AND the user indicates the issue is still not resolved
-   - AND you have enough context about their issue from the conversation
-   - THEN automatically create a ticket with:
-     - Summary: Based on the user's issue
-     - Description: Include the issue details, steps already tried, and why it couldn't be resolved
-    Execute the 'create_ticket' tool immediately.Inform the user: "I've created ticket [TICKET_KEY] to track this issue. Our team will investigate and get back to you."
-
-3. **When NOT to Create Tickets:**
-   - If you can answer the question from the documentation → Just provide the answer
-   - If the user just asked a question → Try to help first, don't immediately create a ticket
-   - If you don't have enough information about the issue → Ask clarifying questions first
-
-General Instructions:
-- ALWAYS try to help the user first using the available documentation
-- Only create tickets when you've attempted to help but couldn't resolve the issue, OR when explicitly requested by the user with proper details
-- Be helpful and conversational - don't jump straight to ticket creation
-
-Context:
-{context_text}
-
-User Question: {query}
-
-IMPORTANT: You must return a valid JSON object as your final response.
-If you use a tool, the tool call happens automatically. Your final response after the tool execution (or if no tool is used) must be the JSON object.
-
-The JSON object must have two keys:
-1. "answer": The natural language answer to the user. If you created a Jira ticket, mention the ticket key in your response.
-2. "used_source_indices": A list of integer indices (e.g. [0, 2]) of the context items that were actually used to generate the answer. If no context was used, return an empty list.
-
-Example format when creating a ticket:
-{{
-  "answer": "I couldn't find information about that in our documentation, so I've created ticket PROJ-123 to track this issue. Our team will investigate and get back to you.",
-  "used_source_indices": []
-}}
-
-Example format when answering from context:
-{{
-  "answer": "Based on our documentation, here's the answer...",
-  "used_source_indices": [0, 2]
-}}"""
-            
-            logger.debug(f"User message prepared (length: {len(user_message)} chars)")
-            
+                self._start_conversation(azure_thread_id)
+
             self.project.agents.messages.create(
-                thread_id=thread.id,
+                thread_id=azure_thread_id,
                 role="user",
-                content=user_message
+                content=self._turn_message(query, context_text)
             )
             logger.info("User message added to thread")
-            
-            
+
             # Run the agent with retry logic for timeouts
             logger.info(f"Starting agent run with agent_id: {self.agent_id}")
-            
+
             max_retries = 3
             retry_count = 0
             run = None
-            
+
             while retry_count < max_retries:
                 try:
                     # Use create instead of create_and_process to manually handle tool calls
                     run = self.project.agents.runs.create(
-                        thread_id=thread.id,
+                        thread_id=azure_thread_id,
                         agent_id=self.agent_id
                     )
                     logger.info(f"Run started: {run.id}")
@@ -362,167 +678,393 @@ Example format when answering from context:
                     else:
                         logger.error(f"Failed to create agent run after {retry_count} attempts: {e}")
                         raise
-            
+
             if run is None:
                 raise Exception("Failed to create agent run after all retries")
 
-
-            
-            # Poll for completion
+            # Poll for completion, quickly at first and backing off while the run takes longer
             poll_count = 0
+            intervals = poll_intervals()
             while True:
                 poll_count += 1
                 response = self.project.agents.runs.get(
-                    thread_id=thread.id,
+                    thread_id=azure_thread_id,
                     run_id=run.id
                 )
                 status = response.status
                 logger.debug(f"Poll {poll_count}: Run status = {status}")
                 print(f"Run status: {status}")
-                
+
                 if status == "requires_action":
                     logger.info("Run requires action (Tool Call). Processing...")
                     print("🔧 Tool call detected!")
                     try:
                         tool_calls = response.required_action.submit_tool_outputs.tool_calls
                         logger.info(f"Number of tool calls: {len(tool_calls)}")
-                        tool_outputs = []
-                        
-                        for tool_call in tool_calls:
-                            logger.info(f"Tool call detected: {tool_call.function.name}")
-                            print(f"Calling tool: {tool_call.function.name}")
-                            
-                            if tool_call.function.name == "create_ticket":
-                                logger.info(f"Executing tool: {tool_call.function.name}")
-                                logger.info(f"Tool arguments: {tool_call.function.arguments}")
-                                try:
-                                    args = json.loads(tool_call.function.arguments)
-                                    logger.info(f"Parsed args: {args}")
-                                    result = self.jira_tool.create_ticket(**args)
-                                    output_str = json.dumps(result)
-                                    logger.info(f"Tool executed. Result: {output_str}")
-                                    print(f"✅ Ticket created: {result}")
-                                except Exception as e:
-                                    logger.error(f"Tool execution failed: {e}", exc_info=True)
-                                    output_str = json.dumps({"status": False, "error": str(e)})
-                                
-                                tool_outputs.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": output_str
-                                })
-
-                        
+                        tool_outputs = [output for output in map(self._run_tool_call, tool_calls) if output]
+
                         if tool_outputs:
+                            tools_called = True
                             self.project.agents.runs.submit_tool_outputs(
-                                thread_id=thread.id,
+                                thread_id=azure_thread_id,
                                 run_id=run.id,
                                 tool_outputs=tool_outputs
                             )
                             logger.info("Tool outputs submitted. Resuming polling...")
+                            # The run resumes at once; look again soon
+                            intervals = poll_intervals()
                     except Exception as e:
                         logger.error(f"Error handling tool calls: {e}", exc_info=True)
                         # Break or handle error? If we can't submit outputs, the run will expire.
                         # We'll continue polling to see if it eventually fails.
-                
-                if status in ("completed", "failed", "cancelled", "expired"):
-                    logger.info(f"Run finished with status: {status}")
-                    if status == "failed":
-                        logger.error(f"Run failed details: {getattr(response, 'last_error', 'No last_error found')}")
-                        # Also protectively log the whole response if possible
-                        try:
-                            logger.error(f"Run response dump: {response}")
-                        except:
-                            pass
+
+                if status in RUN_TERMINAL_STATUSES:
+                    self._log_run_finished(response)
                     break
-                time.sleep(1)
-            
+                time.sleep(next(intervals))
+
             # Get the response if completed
             if status == "completed":
                 logger.info("Fetching assistant response...")
-                messages = list(self.project.agents.messages.list(thread_id=thread.id))
-                logger.debug(f"Retrieved {len(messages)} messages from thread")
-                
-                for msg in messages:
-                    if msg.role == "assistant":
-                        # Attempt to parse JSON response
-                        raw_content = msg.content[0].text.value.strip()
-                        
-                        # Clean up markdown code blocks if present
-                        if raw_content.startswith("```json"):
-                            raw_content = raw_content[7:]
-                        if raw_content.startswith("```"):
-                            raw_content = raw_content[3:]
-                        if raw_content.endswith("```"):
-                            raw_content = raw_content[:-3]
-                            
-                        raw_content = raw_content.strip()
-                        
-                        used_matches = []
-                        answer = raw_content
-                        
-                        try:
-                            parsed = json.loads(raw_content)
-                            answer = parsed.get("answer", raw_content)
-                            indices = parsed.get("used_source_indices", [])
-                            
-                            # Filter matches based on indices
-                            for idx in indices:
-                                if isinstance(idx, int) and 0 <= idx < len(matches):
-                                    used_matches.append(matches[idx])
-                                    
-                            logger.info(f"Successfully parsed structured response. Used {len(used_matches)} sources.")
-                        except json.JSONDecodeError:
-                            logger.warning("Failed to parse JSON response, falling back to raw text and all sources.")
-                            # Fallback: keep raw answer, assume NO sources clearly identified (or could assume ALL)
-                            # User requested specific sources. If we can't parse, it's safer to return none or all.
-                            # Let's return matches as is to maintain legacy behavior on failure to parse
-                            used_matches = matches 
-
-                        logger.info(f"Assistant response received (length: {len(answer)} chars)")
-                        logger.debug(f"Assistant response: {answer[:200]}...")
-                        
-                        # Store the conversation
-                        if thread.id in self.conversations:
-                            # Add user message
-                            self.conversations[thread.id]["messages"].append({
-                                "role": "user",
-                                "content": query,
-                                "timestamp": datetime.now().isoformat(),
-                                "sources": None
-                            })
-                            
-                            # Add assistant message
-                            sources_info = [{
-                                "source": match['metadata']['source'],
-                                "chunk_text": match['metadata']['chunk_text'][:200] + "...",
-                                "chunk_index": match['metadata']['chunk_index']
-                            } for match in used_matches]
-                            
-                            self.conversations[thread.id]["messages"].append({
-                                "role": "assistant",
-                                "content": answer,
-                                "timestamp": datetime.now().isoformat(),
-                                "sources": sources_info
-                            })
-                            
-                            # Update timestamp
-                            self.conversations[thread.id]["updated_at"] = datetime.now().isoformat()
-                            
-                            logger.info(f"Conversation updated: {thread.id}")
-                        
-                        return answer, thread.id, used_matches
-                        
+                reply = self._run_reply(azure_thread_id, run.id)
+                if reply is not None:
+                    answer, used_matches, parsed_ok = self._parse_reply(reply, context_blocks)
+                    self._record_turn(conversation_id, query, answer, used_matches)
+
+                    # Only plain answers are reusable: never replay a turn that created a ticket
+                    if self.answer_cache and first_turn and parsed_ok and not tools_called:
+                        self._cache_answer(conversation_id, query, self.embed_query(query), matches, answer, used_matches, generation)
+
+                    return answer, conversation_id, used_matches
+
                 logger.warning("No assistant message found in thread")
-                return "No response from agent.", thread.id, []
+                return "No response from agent.", conversation_id, []
             else:
                 error_msg = f"Agent run {status}. Please try again."
                 logger.error(error_msg)
-                return error_msg, thread.id, []
-                
+                return error_msg, conversation_id, []
+
+        except Exception as e:
+            logger.error(f"Error generating answer: {e}", exc_info=True)
+            raise
+
+    async def _await_run(self, thread_id: str, run_id: str, handle_tool_calls=True):
+        """
+        Poll a run on the async client until it finishes, quickly at first and
+        backing off while it takes longer. Tool calls are executed off the event
+        loop and their outputs submitted. Returns the final run and whether any
+        tool output was submitted.
+        """
+        agents = self.aproject.agents
+        tools_called = False
+        poll_count = 0
+        intervals = poll_intervals()
+        while True:
+            poll_count += 1
+            response = await agents.runs.get(thread_id=thread_id, run_id=run_id)
+            status = response.status
+            logger.debug(f"Poll {poll_count}: Run status = {status}")
+
+            if status == "requires_action" and handle_tool_calls:
+                logger.info("Run requires action (Tool Call). Processing...")
+                try:
+                    tool_calls = response.required_action.submit_tool_outputs.tool_calls
+                    logger.info(f"Number of tool calls: {len(tool_calls)}")
+                    tool_outputs = []
+                    for tool_call in tool_calls:
+                        # The Jira client is synchronous
+                        output = await asyncio.to_thread(self._run_tool_call, tool_call)
+                        if output:
+                            tool_outputs.append(output)
+
+                    if tool_outputs:
+                        tools_called = True
+                        await agents.runs.submit_tool_outputs(
+                            thread_id=thread_id,
+                            run_id=run_id,
+                            tool_outputs=tool_outputs
+                        )
+                        logger.info("Tool outputs submitted. Resuming polling...")
+                        intervals = poll_intervals()
+                except Exception as e:
+                    logger.error(f"Error handling tool calls: {e}", exc_info=True)
+
+            if status in RUN_TERMINAL_STATUSES:
+                self._log_run_finished(response)
+                if handle_tool_calls:
+                    return response, tools_called
+                return response
+            await asyncio.sleep(next(intervals))
+
+    async def _aopen_turn(self, user_message, thread_id: Optional[str] = None):
+        """
+        Thread for a turn on the async client, with the user message added.
+        Returns (conversation_id, azure_thread_id, first_turn).
+        """
+        agents = self.aproject.agents
+        first_turn = not (thread_id and thread_id in self.conversations)
+        if not first_turn:
+            logger.info(f"Using existing thread: {thread_id}")
+            conversation_id = thread_id
+            azure_thread_id = self.conversations[thread_id].get("azure_thread_id", thread_id)
+            if azure_thread_id is None:
+                azure_thread_id = await self._acreate_thread_with_history(thread_id)
+        else:
+            logger.info("Creating new Azure thread...")
+            azure_thread_id = (await agents.threads.create()).id
+            conversation_id = azure_thread_id
+            self._start_conversation(azure_thread_id)
+
+        await agents.messages.create(
+            thread_id=azure_thread_id,
+            role="user",
+            content=user_message
+        )
+        logger.info("User message added to thread")
+        return conversation_id, azure_thread_id, first_turn
+
+    async def _afinish_turn(self, conversation_id, query, reply, context_blocks, matches, first_turn, tools_called, generation):
+        """Parse the assistant's reply, store the turn and cache the answer if reusable"""
+        answer, used_matches, parsed_ok = self._parse_reply(reply, context_blocks)
+        self._record_turn(conversation_id, query, answer, used_matches)
+
+        # Only plain answers are reusable: never replay a turn that created a ticket
+        if self.answer_cache and first_turn and parsed_ok and not tools_called:
+            query_vector = await asyncio.to_thread(self.embed_query, query)
+            self._cache_answer(conversation_id, query, query_vector, matches, answer, used_matches, generation)
+        return answer, used_matches
+
+    async def agenerate_answer(self, query, matches, thread_id: Optional[str] = None):
+        """
+        generate_answer on the async Azure client. Waiting for Azure never
+        blocks the event loop, so one worker keeps many runs in flight (up to
+        AZURE_MAX_CONCURRENT_RUNS).
+        """
+        logger.info(f"Generating answer for query: '{query}'")
+        agents = self.aproject.agents
+        try:
+            generation = index_generation()
+            context_blocks, context_text = self._context_text(matches)
+            user_message = self._turn_message(query, context_text)
+
+            async with self._run_slots:
+                conversation_id, azure_thread_id, first_turn = await self._aopen_turn(user_message, thread_id)
+
+                logger.info(f"Starting agent run with agent_id: {self.agent_id}")
+                max_retries = 3
+                for retry_count in range(1, max_retries + 1):
+                    try:
+                        run = await agents.runs.create(
+                            thread_id=azure_thread_id,
+                            agent_id=self.agent_id
+                        )
+                        logger.info(f"Run started: {run.id}")
+                        break
+                    except Exception as e:
+                        if "timed out" in str(e).lower() and retry_count < max_retries:
+                            logger.warning(f"Azure request timed out (attempt {retry_count}/{max_retries}). Retrying...")
+                            await asyncio.sleep(2 * retry_count)  # Exponential backoff
+                            continue
+                        logger.error(f"Failed to create agent run after {retry_count} attempts: {e}")
+                        raise
+
+                response, tools_called = await self._await_run(azure_thread_id, run.id)
+                status = response.status
+
+                if status != "completed":
+                    error_msg = f"Agent run {status}. Please try again."
+                    logger.error(error_msg)
+                    return error_msg, conversation_id, []
+
+                logger.info("Fetching assistant response...")
+                reply = await self._arun_reply(azure_thread_id, run.id)
+
+            if reply is None:
+                logger.warning("No assistant message found in thread")
+                return "No response from agent.", conversation_id, []
+
+            answer, used_matches = await self._afinish_turn(
+                conversation_id, query, reply, context_blocks, matches, first_turn, tools_called, generation
+            )
+            return answer, conversation_id, used_matches
+
         except Exception as e:
             logger.error(f"Error generating answer: {e}", exc_info=True)
             raise
 
+    async def astream_answer(self, query, matches, thread_id: Optional[str] = None):
+        """
+        Answer like agenerate_answer, streaming the Azure run. Yields (event, data):
+        - ("thread", {"thread_id"}) once the conversation's thread is known
+        - ("token", {"text"}) for each piece of the answer text as it is generated
+        - ("tool_call", {"name", "arguments"}) and ("tool_result", {"name", "result"}) around tool execution
+        - ("answer", {"answer", "thread_id", "used_matches"}) last, with the final parsed answer
+        A failed run ends with ("answer", ...) carrying the error message and no matches.
+        """
+        logger.info(f"Streaming answer for query: '{query}'")
+        agents = self.aproject.agents
+        generation = index_generation()
+        context_blocks, context_text = self._context_text(matches)
+        user_message = self._turn_message(query, context_text)
+
+        async with self._run_slots:
+            conversation_id, azure_thread_id, first_turn = await self._aopen_turn(user_message, thread_id)
+            yield "thread", {"thread_id": conversation_id}
+
+            # One handler for the whole run: tool output submissions continue its event stream
+            handler = AsyncAgentEventHandler()
+            replies = {}  # message id -> (reply text so far, answer text parser)
+            reply_id = None
+            tools_called = False
+            status = None
+
+            logger.info(f"Starting streamed agent run with agent_id: {self.agent_id}")
+            async with await agents.runs.stream(
+                thread_id=azure_thread_id,
+                agent_id=self.agent_id,
+                event_handler=handler
+            ) as stream:
+                async for event_type, event_data, _ in stream:
+                    if isinstance(event_data, MessageDeltaChunk):
+                        text, parser = replies.get(event_data.id) or ("", AnswerTextStream())
+                        delta = event_data.text or ""
+                        replies[event_data.id] = (text + delta, parser)
+                        reply_id = event_data.id
+                        piece = parser.feed(delta)
+                        if piece:
+                            yield "token", {"text": piece}
+
+                    elif isinstance(event_data, ThreadRun):
+                        status = event_data.status
+                        if status == "requires_action":
+                            logger.info("Run requires action (Tool Call). Processing...")
+                            tool_outputs = []
+                            for tool_call in event_data.required_action.submit_tool_outputs.tool_calls:
+                                yield "tool_call", {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                                output = await asyncio.to_thread(self._run_tool_call, tool_call)
+                                if output:
+                                    tool_outputs.append(output)
+                                    yield "tool_result", {"name": tool_call.function.name, "result": json.loads(output["output"])}
+                            if tool_outputs:
+                                tools_called = True
+                                await agents.runs.submit_tool_outputs_stream(
+                                    thread_id=azure_thread_id,
+                                    run_id=event_data.id,
+                                    tool_outputs=tool_outputs,
+                                    event_handler=handler
+                                )
+                                logger.info("Tool outputs submitted. Resuming stream...")
+                        elif status in RUN_TERMINAL_STATUSES:
+                            self._log_run_finished(event_data)
+
+                    elif event_type == "error":
+                        logger.error(f"Run stream error: {event_data}")
+                        status = "failed"
+
+        if status != "completed":
+            error_msg = f"Agent run {status}. Please try again."
+            logger.error(error_msg)
+            yield "answer", {"answer": error_msg, "thread_id": conversation_id, "used_matches": []}
+            return
+        if reply_id is None:
+            logger.warning("No assistant message in run stream")
+            yield "answer", {"answer": "No response from agent.", "thread_id": conversation_id, "used_matches": []}
+            return
+
+        answer, used_matches = await self._afinish_turn(
+            conversation_id, query, replies[reply_id][0], context_blocks, matches, first_turn, tools_called, generation
+        )
+        yield "answer", {"answer": answer, "thread_id": conversation_id, "used_matches": used_matches}
+
+    def build_context(self, matches):
+        """
+        Context blocks {"source", "text", "matches"} for the prompt: packed by
+        the context packer, or one block per match when packing is disabled
+        """
+        if self.context_packer:
+            return self.context_packer.pack(matches)
+        return [{
+            "source": match['metadata']['source'],
+            "text": match['metadata']['chunk_text'],
+            "matches": [match]
+        } for match in matches]
+
+    def answer_from_cache(self, query, matches):
+        """
+        Answer a first-turn question from the semantic answer cache.
+        Returns (answer, thread_id, used_matches) like generate_answer, or None on a miss.
+        The conversation gets its Azure thread only if the user follows up.
+        """
+        if not self.answer_cache:
+            return None
+        entry = self.answer_cache.lookup(self.embed_query(query), matches)
+        if entry is None:
+            return None
+        logger.info(f"Answer cache hit (similarity {entry['similarity']:.3f})")
+
+        by_id = {match['id']: match for match in matches}
+        used_matches = [by_id[match_id] for match_id in entry["used_ids"] if match_id in by_id]
+        thread_id = f"thread_{uuid.uuid4().hex[:16]}"
+        now = datetime.now().isoformat()
+        self.conversations[thread_id] = {
+            "thread_id": thread_id,
+            "azure_thread_id": None,
+            "answer_cache_key": entry["key"],
+            "title": entry["title"],
+            "created_at": now,
+            "updated_at": now,
+            "messages": [
+                {"role": "user", "content": query, "timestamp": now, "sources": None},
+                {
+                    "role": "assistant",
+                    "content": entry["answer"],
+                    "timestamp": now,
+                    "sources": [{
+                        "source": match['metadata']['source'],
+                        "chunk_text": match['metadata']['chunk_text'][:200] + "...",
+                        "chunk_index": match['metadata']['chunk_index']
+                    } for match in used_matches]
+                }
+            ]
+        }
+        return entry["answer"], thread_id, used_matches
+
+    def _create_thread_with_history(self, thread_id: str) -> str:
+        """
+        Create the Azure thread for a conversation answered from the cache,
+        replaying its messages so far so follow-ups have the context.
+        """
+        thread = self.project.agents.threads.create()
+        for message in self.conversations[thread_id]["messages"]:
+            self.project.agents.messages.create(
+                thread_id=thread.id,
+                role=message["role"],
+                content=message["content"]
+            )
+        self.conversations[thread_id]["azure_thread_id"] = thread.id
+        logger.info(f"Created thread {thread.id} for cached conversation {thread_id}")
+        return thread.id
+
+    async def _acreate_thread_with_history(self, thread_id: str) -> str:
+        """_create_thread_with_history on the async client"""
+        agents = self.aproject.agents
+        thread = await agents.threads.create()
+        for message in self.conversations[thread_id]["messages"]:
+            await agents.messages.create(
+                thread_id=thread.id,
+                role=message["role"],
+                content=message["content"]
+            )
+        self.conversations[thread_id]["azure_thread_id"] = thread.id
+        logger.info(f"Created thread {thread.id} for cached conversation {thread_id}")
+        return thread.id
+
+    async def aclose(self):
+        """Stop pending title jobs and close the async Azure client and its credential"""
+        await self.title_jobs.aclose()
+        await self.aproject.close()
+        await self.acredential.close()
+
     def get_conversations(self) -> List[Dict]:
         """
         Get all conversations with their metadata
@@ -571,25 +1113,88 @@ Example format when answering from context:
         logger.warning(f"Conversation not found for deletion: {thread_id}")
         return False
 
-    def update_conversation_title(self, thread_id: str, title: str) -> bool:
+    def update_conversation_title(self, thread_id: str, title: str, cache_title: bool = False) -> bool:
         """
-        Update the title of a conversation
+        Update the title of a conversation. With cache_title the title is also
+        stored with the conversation's cached answer, for conversations that
+        reuse it; only generated titles are, never a user's rename.
         """
         logger.info(f"Updating title for conversation {thread_id}: '{title}'")
         if thread_id in self.conversations:
             self.conversations[thread_id]["title"] = title
             self.conversations[thread_id]["updated_at"] = datetime.now().isoformat()
+            cache_key = self.conversations[thread_id].get("answer_cache_key")
+            if cache_title and cache_key and self.answer_cache:
+                self.answer_cache.set_title(cache_key, title)
             logger.info(f"Title updated successfully")
             return True
         logger.warning(f"Conversation not found for title update: {thread_id}")
         return False
 
+    def start_conversation_title(self, thread_id: str, first_message: str) -> str:
+        """
+        Give a new conversation an extractive title at once and start generating
+        its real title in the background. Returns the extractive title.
+        Must be called from the event loop.
+        """
+        title = extractive_title(first_message)
+        self.update_conversation_title(thread_id, title)
+        self.conversations[thread_id]["provisional_title"] = title
+        if not self.title_jobs.schedule(thread_id, first_message):
+            self.conversations[thread_id].pop("provisional_title", None)
+        return title
+
+    def _apply_generated_title(self, thread_id: str, title: Optional[str]):
+        conversation = self.conversations.get(thread_id)
+        if conversation is None:
+            return
+        provisional = conversation.pop("provisional_title", None)
+        # A title set by the user in the meantime is kept
+        if title and conversation.get("title") == provisional:
+            self.update_conversation_title(thread_id, title, cache_title=True)
+
+    def get_conversation_title(self, thread_id: str) -> Optional[Dict]:
+        """
+        Current title of a conversation; status is "pending" while its
+        generated title is still being produced, otherwise "final"
+        """
+        if thread_id not in self.conversations:
+            return None
+        return {
+            "thread_id": thread_id,
+            "title": self.conversations[thread_id].get("title") or "New Conversation",
+            "status": "pending" if self.title_jobs.is_pending(thread_id) else "final"
+        }
+
+    def rerank(self, query, matches):
+        """
+        Best matches for the prompt: reranked by the cross-encoder when enabled,
+        otherwise the retrieval results unchanged
+        """
+        if not self.reranker or not matches:
+            return matches
+        return self.reranker.rerank(query, matches)
+
+    def get_metrics(self) -> Dict:
+        """
+        Performance metrics of the query path
+        """
+        return {
+            "query_embedding": self.query_embedder.stats() if self.query_embedder else None,
+            "query_cache": self.retrieval_cache.stats() if self.retrieval_cache else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "rerank": self.reranker.stats() if self.reranker else None,
+            "context": self.context_packer.stats() if self.context_packer else None,
+            "prompt": self.prompt_accounting.stats(),
+            "titles": self.title_jobs.stats()
+        }
+
     def ask(self, query):
         print(f"\nUser Question: {query}")
         print("Searching knowledge base...")
         
         # 1. Retrieve relevant context
-        matches = self.search_knowledge_base(query)
+        matches = self.rerank(query, self.search_knowledge_base(query))
         
         if not matches:
             return "I couldn't find any information about that in the knowledge base."
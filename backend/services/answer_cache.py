@@ -0,0 +1,140 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from core.config import *
+from core.index_state import index_generation
+
+
+class SemanticAnswerCache:
+    """
+    Answers to first-turn questions, keyed by query embedding.
+
+    A question hits when its cosine similarity to a cached question is at
+    least `threshold` AND retrieval returned exactly the same chunks, so a
+    cached answer is only reused when it was grounded in the same context.
+    Entries expire after `ttl` seconds, are evicted least-recently-used past
+    `max_entries`, and are dropped once ingestion has written to the index.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.source_mismatches = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _source_ids(matches):
+        return frozenset(match['id'] for match in matches)
+
+    def _prune_locked(self):
+        now = time.monotonic()
+        generation = index_generation()
+        for key in list(self._entries):
+            entry = self._entries[key]
+            if entry["generation"] != generation:
+                del self._entries[key]
+                self.invalidations += 1
+            elif entry["expires_at"] < now:
+                del self._entries[key]
+                self.expirations += 1
+
+    def lookup(self, vector, matches):
+        """
+        Cached entry for a question, or None. The entry holds the answer, the
+        ids of the matches it used, the cosine similarity and the title if known.
+        """
+        query = self._unit(vector)
+        source_ids = self._source_ids(matches)
+        with self._lock:
+            self._prune_locked()
+            if self._entries:
+                keys = list(self._entries)
+                similarities = np.vstack([self._entries[key]["vector"] for key in keys]) @ query
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    entry = self._entries[keys[i]]
+                    if entry["source_ids"] != source_ids:
+                        self.source_mismatches += 1
+                        continue
+                    self._entries.move_to_end(keys[i])
+                    self.hits += 1
+                    return {
+                        "key": keys[i],
+                        "answer": entry["answer"],
+                        "used_ids": list(entry["used_ids"]),
+                        "title": entry["title"],
+                        "similarity": float(similarities[i])
+                    }
+            self.misses += 1
+            return None
+
+    def put(self, vector, matches, answer, used_matches, generation):
+        """
+        Cache an answer. `generation` is the index generation the matches were
+        retrieved at; an answer from before a reindex is not stored.
+        Returns the entry key, or None if not stored.
+        """
+        if generation != index_generation():
+            return None
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._entries[key] = {
+                "vector": self._unit(vector),
+                "source_ids": self._source_ids(matches),
+                "used_ids": [match['id'] for match in used_matches],
+                "answer": answer,
+                "title": None,
+                "generation": generation,
+                "expires_at": time.monotonic() + self.ttl
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    def set_title(self, key, title):
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["title"] = title
+
+    def invalidate(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "source_mismatches": self.source_mismatches,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold
+            }
@@ -1,24 +1,22 @@
 import os
 import sys
 from datetime import datetime
-from pinecone import Pinecone
-from core.config import PINECONE_API_KEY, INDEX_NAME
+from core.config import VECTOR_DIMENSION
+from core.vector_store import get_vector_store
 from models.user import UserSignup, UserInDB, UserRole
 from core.security import get_password_hash
 
 class AuthService:
     def __init__(self):
-        self.pc = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = self.pc.Index(INDEX_NAME)
+        self.vector_store = get_vector_store()
         self.namespace = "users"
-        self.vector_dim = 384  # Must match index dimension
+        self.vector_dim = VECTOR_DIMENSION  # Must match index dimension
 
     def get_user(self, username: str) -> UserInDB | None:
         try:
-            response = self.index.fetch(ids=[username], namespace=self.namespace)
-            if username in response.vectors:
-                data = response.vectors[username]
-                metadata = data.metadata
+            records = self.vector_store.fetch([username], namespace=self.namespace)
+            if username in records:
+                metadata = records[username]["metadata"]
                 return UserInDB(
                     username=username,
                     hashed_password=metadata.get("hashed_password"),
@@ -50,8 +48,8 @@ class AuthService:
         }
 
         try:
-            self.index.upsert(
-                vectors=[{
+            self.vector_store.upsert(
+                [{
                     "id": user.username,
                     "values": dummy_vector,
                     "metadata": metadata
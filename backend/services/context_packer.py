@@ -0,0 +1,225 @@
+import copy
+import threading
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.config import *
+from core.bm25 import tokenize
+from core.metrics import Distribution
+
+# Rough characters per token, used when there is no tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def _append_chunk(text, previous, metadata):
+    """
+    `text` continued by the chunk in `metadata`, which follows `previous` on the page.
+    Only the overlap the chunker recorded (chunk_overlap) is removed, and only if
+    `previous` really ends with it; otherwise the chunks are joined unchanged.
+    """
+    chunk = metadata['chunk_text']
+    overlap = metadata.get('chunk_overlap', 0)
+    if overlap and previous.endswith(chunk[:overlap]):
+        # Overlapping windows of the same text: the rest of the chunk continues it directly
+        return text + chunk[overlap:]
+    return text.rstrip() + " " + chunk.lstrip()
+
+
+def _relevance(match):
+    return match.get('rerank_score', match['score'])
+
+
+def _similarity(a, b):
+    """Jaccard similarity of two term sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    """
+    Turns retrieved matches into the numbered context blocks of the prompt:
+
+    1. Matches more than `score_cliff` (cosine) below the next better match
+       are dropped, together with everything ranked under them. BM25 hits
+       (`keyword_match`) are exempt: an exact term can match a chunk whose
+       vector doesn't.
+    2. Retrieved chunks that are neighbours on the same page (consecutive
+       chunk_index) are merged into one block, without the overlap their
+       chunker recorded.
+    3. Blocks are ordered by maximal marginal relevance, trading relevance
+       against term overlap with the blocks already chosen; near-duplicates
+       (overlap of at least `duplicate_similarity`) are dropped.
+    4. Blocks are added in that order while they fit `max_tokens`, counted
+       with the tokenizer.
+
+    Each block keeps the matches it was built from, so an index into the
+    blocks resolves to the original matches.
+    """
+
+    def __init__(self, tokenizer=None, max_tokens=CONTEXT_MAX_TOKENS, mmr_lambda=CONTEXT_MMR_LAMBDA,
+                 score_cliff=CONTEXT_SCORE_CLIFF, duplicate_similarity=CONTEXT_DUPLICATE_SIMILARITY):
+        # A private copy: a fast tokenizer can't be used by the embedder and the packer at once
+        self.tokenizer = copy.deepcopy(tokenizer) if tokenizer is not None else None
+        self._tokenizer_lock = threading.Lock()
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.score_cliff = score_cliff
+        self.duplicate_similarity = duplicate_similarity
+        self._stats_lock = threading.Lock()
+        self.packed_tokens = Distribution()
+        self.matches_in = 0
+        self.matches_packed = 0
+        self.dropped_cliff = 0
+        self.dropped_duplicate = 0
+        self.dropped_budget = 0
+        self.merged = 0
+        self.truncated = 0
+
+    def count_tokens(self, texts):
+        if self.tokenizer is None:
+            return [max(1, len(text) // CHARS_PER_TOKEN) for text in texts]
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(texts, add_special_tokens=False, truncation=False, verbose=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _truncate(self, text, tokens):
+        """Cut `text` to at most `tokens` tokens"""
+        if self.tokenizer is None:
+            return text[:tokens * CHARS_PER_TOKEN]
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(
+                text, add_special_tokens=False, truncation=False,
+                return_offsets_mapping=True, verbose=False
+            )
+        offsets = encoded["offset_mapping"][:tokens]
+        return text[:offsets[-1][1]] if offsets else ""
+
+    def _above_cliff(self, matches):
+        ranked = sorted((match for match in matches if not match.get('keyword_match')),
+                        key=lambda match: match['score'], reverse=True)
+        cutoff = len(ranked)
+        for i in range(1, len(ranked)):
+            if ranked[i - 1]['score'] - ranked[i]['score'] > self.score_cliff:
+                cutoff = i
+                break
+        kept = {match['id'] for match in ranked[:cutoff]}
+        return [match for match in matches if match.get('keyword_match') or match['id'] in kept]
+
+    @staticmethod
+    def _merge_neighbours(matches):
+        """Blocks of consecutive chunks from the same page, best ranked block first"""
+        by_page = {}
+        for rank, match in enumerate(matches):
+            metadata = match['metadata']
+            page = metadata.get('page_id', metadata['source'])
+            by_page.setdefault(page, []).append((metadata['chunk_index'], rank, match))
+
+        blocks = []
+        for chunks in by_page.values():
+            chunks.sort(key=lambda chunk: chunk[0])
+            run = [chunks[0]]
+            for chunk in chunks[1:]:
+                if chunk[0] == run[-1][0] + 1:
+                    run.append(chunk)
+                else:
+                    blocks.append(run)
+                    run = [chunk]
+            blocks.append(run)
+
+        merged = []
+        for run in blocks:
+            members = [match for _, _, match in run]
+            text = members[0]['metadata']['chunk_text']
+            for previous, match in zip(members, members[1:]):
+                text = _append_chunk(text, previous['metadata']['chunk_text'], match['metadata'])
+            merged.append({
+                "source": members[0]['metadata']['source'],
+                "text": text,
+                "matches": members,
+                "rank": min(rank for _, rank, _ in run),
+                "relevance": max(_relevance(match) for match in members)
+            })
+        merged.sort(key=lambda block: block["rank"])
+        return merged
+
+    def _mmr_order(self, blocks):
+        """Blocks in maximal-marginal-relevance order, near-duplicates removed"""
+        if not blocks:
+            return [], 0
+        relevances = [block["relevance"] for block in blocks]
+        low, high = min(relevances), max(relevances)
+        spread = (high - low) or 1.0
+        for block in blocks:
+            block["terms"] = set(tokenize(block["text"]))
+            block["norm_relevance"] = (block["relevance"] - low) / spread
+
+        remaining = list(blocks)
+        selected = []
+        duplicates = 0
+        while remaining:
+            best, best_score, best_overlap = None, None, 0.0
+            for block in remaining:
+                overlap = max((_similarity(block["terms"], chosen["terms"]) for chosen in selected), default=0.0)
+                score = self.mmr_lambda * block["norm_relevance"] - (1 - self.mmr_lambda) * overlap
+                if best_score is None or score > best_score:
+                    best, best_score, best_overlap = block, score, overlap
+            remaining.remove(best)
+            if best_overlap >= self.duplicate_similarity:
+                duplicates += 1
+                continue
+            selected.append(best)
+        return selected, duplicates
+
+    def pack(self, matches):
+        """
+        Context blocks for the prompt, each {"source", "text", "matches"}.
+        The first block is always included, cut to the budget if it is too long.
+        """
+        if not matches:
+            return []
+        kept = self._above_cliff(matches)
+        blocks = self._merge_neighbours(kept)
+        ordered, duplicates = self._mmr_order(blocks)
+
+        packed = []
+        used = 0
+        dropped_budget = 0
+        truncated = False
+        for block, tokens in zip(ordered, self.count_tokens([block["text"] for block in ordered])):
+            if used + tokens > self.max_tokens:
+                if packed:
+                    dropped_budget += len(block["matches"])
+                    continue
+                block["text"] = self._truncate(block["text"], self.max_tokens)
+                tokens = self.max_tokens
+                truncated = True
+            packed.append({"source": block["source"], "text": block["text"], "matches": block["matches"]})
+            used += tokens
+
+        with self._stats_lock:
+            self.packed_tokens.add(used)
+            self.matches_in += len(matches)
+            self.matches_packed += sum(len(block["matches"]) for block in packed)
+            self.dropped_cliff += len(matches) - len(kept)
+            self.dropped_duplicate += duplicates
+            self.dropped_budget += dropped_budget
+            self.merged += len(kept) - len(blocks)
+            self.truncated += int(truncated)
+        return packed
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_tokens": self.max_tokens,
+                "tokenizer": self.tokenizer is not None,
+                "matches_in": self.matches_in,
+                "matches_packed": self.matches_packed,
+                "dropped_cliff": self.dropped_cliff,
+                "dropped_duplicate_blocks": self.dropped_duplicate,
+                "dropped_budget": self.dropped_budget,
+                "merged_chunks": self.merged,
+                "truncated_blocks": self.truncated,
+                "packed_tokens": self.packed_tokens.summary()
+            }
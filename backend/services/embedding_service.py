@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.config import *
+from core.logger import setup_logger
+from core.metrics import Distribution
+
+logger = setup_logger('embedding_service')
+
+_STOP = object()
+
+
+class EmbeddingService:
+    """
+    Micro-batches query embeddings across concurrent requests.
+
+    Callers block in encode() while a single worker thread collects the
+    queries that arrive within max_wait_ms of the first one (up to
+    max_batch_size) and encodes them in one model call. Each caller gets
+    its own vector back, or the exception the batch raised.
+    """
+
+    def __init__(self, model, max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self.batch_sizes = Distribution()
+        self.queue_delay_ms = Distribution()
+        self.encode_ms = Distribution()
+        self._thread = threading.Thread(target=self._worker, name="query-embedder", daemon=True)
+        self._thread.start()
+
+    def encode(self, text, timeout=None):
+        """Vector for one query; blocks until the batch it joined has been encoded"""
+        future = Future()
+        self._queue.put((text, time.monotonic(), future))
+        return future.result(timeout)
+
+    def _collect(self, first):
+        """The first request plus whatever arrives before its wait runs out"""
+        batch = [first]
+        deadline = first[1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+
+            started = time.monotonic()
+            for _, enqueued_at, _ in batch:
+                self.queue_delay_ms.add((started - enqueued_at) * 1000)
+            self.batch_sizes.add(len(batch))
+
+            # The same question asked concurrently only needs encoding once
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts))
+            except Exception as e:
+                logger.error(f"Batch of {len(texts)} query embeddings failed: {e}", exc_info=True)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.encode_ms.add((time.monotonic() - started) * 1000)
+
+            by_text = dict(zip(texts, vectors))
+            for text, _, future in batch:
+                future.set_result(by_text[text])
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size": self.batch_sizes.summary(),
+            "queue_delay_ms": self.queue_delay_ms.summary(),
+            "encode_ms": self.encode_ms.summary()
+        }
+
+    def shutdown(self):
+        self._queue.put(_STOP)
@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.logger import setup_logger
+
+logger = setup_logger('ingestion_jobs')
+
+# Counter used to compute each stage's throughput
+THROUGHPUT_COUNTERS = {
+    "fetch": ("pages_fetched", "pages_per_second"),
+    "embed": ("chunks_embedded", "chunks_per_second"),
+    "upsert": ("vectors_upserted", "vectors_per_second"),
+}
+
+
+class IngestionJobManager:
+    """
+    Runs the ingestion pipeline as a background job so API requests never block
+    on it. Only one run is active at a time: starting a job while another is
+    queued or running returns the existing job instead of a second run.
+    """
+
+    def __init__(self, pipeline_factory, max_history=20):
+        # The pipeline (and its embedding model) is created on first use
+        self._pipeline_factory = pipeline_factory
+        self._pipeline = None
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, Dict] = {}
+        self.max_history = max_history
+        self._active_job_id: Optional[str] = None
+        self._done: Dict[str, threading.Event] = {}
+
+    def _get_pipeline(self):
+        if self._pipeline is None:
+            self._pipeline = self._pipeline_factory()
+        return self._pipeline
+
+    def start(self, force: bool = False) -> Dict:
+        """Start an ingestion job, or return the one already in progress"""
+        with self._lock:
+            active_job_id = self._active_job_id
+            if not active_job_id:
+                job_id = uuid.uuid4().hex
+                self.jobs[job_id] = {
+                    "job_id": job_id,
+                    "status": "queued",
+                    "force": force,
+                    "created_at": datetime.now().isoformat(),
+                    "started_at": None,
+                    "finished_at": None,
+                    "error": None,
+                    "result": None
+                }
+                self._done[job_id] = threading.Event()
+                self._active_job_id = job_id
+                self._trim_history()
+
+        if active_job_id:
+            logger.info(f"Ingestion job {active_job_id} already in progress, not starting another")
+            return self.get(active_job_id)
+
+        thread = threading.Thread(target=self._run, args=(job_id,), name=f"ingest-job-{job_id[:8]}", daemon=True)
+        thread.start()
+        logger.info(f"Started ingestion job {job_id} (force={force})")
+        return self.get(job_id)
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("completed", "failed")]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_history)]:
+            del self.jobs[job_id]
+            self._done.pop(job_id, None)
+
+    def _run(self, job_id: str):
+        job = self.jobs[job_id]
+        # get() reads "_start" as soon as the job shows as running
+        with self._lock:
+            job["started_at"] = datetime.now().isoformat()
+            job["_start"] = time.monotonic()
+            job["status"] = "running"
+        pipeline = None
+        try:
+            pipeline = self._get_pipeline()
+            job["result"] = dict(pipeline.run_pipeline(force=job["force"]))
+            job["status"] = "completed"
+            logger.info(f"Ingestion job {job_id} completed: {job['result']}")
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"Ingestion job {job_id} failed: {e}", exc_info=True)
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            job["_elapsed"] = time.monotonic() - job["_start"]
+            # Freeze this run's counters; the next run resets the pipeline's
+            job["_progress"] = pipeline.progress() if pipeline else {}
+            with self._lock:
+                if self._active_job_id == job_id:
+                    self._active_job_id = None
+            self._done[job_id].set()
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Block until the job has finished (or timeout), then return its status"""
+        done = self._done.get(job_id)
+        if done:
+            done.wait(timeout)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Job status with per-stage progress and throughput"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+
+        report = {key: value for key, value in job.items() if not key.startswith("_")}
+        if "_progress" in job:
+            elapsed = job["_elapsed"]
+            progress = {stage: dict(counters) for stage, counters in job["_progress"].items()}
+        elif job["status"] == "running" and self._pipeline is not None:
+            elapsed = time.monotonic() - job["_start"]
+            progress = self._pipeline.progress()
+        else:
+            report["progress"] = {}
+            report["elapsed_seconds"] = 0.0
+            return report
+
+        for stage, (counter, rate_name) in THROUGHPUT_COUNTERS.items():
+            stage_progress = progress.get(stage, {})
+            stage_progress[rate_name] = round(stage_progress.get(counter, 0) / elapsed, 2) if elapsed else 0.0
+        report["progress"] = progress
+        report["elapsed_seconds"] = round(elapsed, 2)
+        return report
+
+    def active_job(self) -> Optional[Dict]:
+        with self._lock:
+            job_id = self._active_job_id
+        return self.get(job_id) if job_id else None
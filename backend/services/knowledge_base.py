@@ -2,37 +2,26 @@ import requests
 from requests.auth import HTTPBasicAuth
 from bs4 import BeautifulSoup
 import os
-from pinecone import Pinecone
 import uuid
-from sentence_transformers import SentenceTransformer
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from core.config import *
+from core.vector_store import get_vector_store
+from core.embedding_cache import EmbeddingCache
+from core.embeddings import get_embedding_model
+from core.index_state import bump_index_generation
 
 class KnowledgeBase:
     def __init__(self):
         self.documents = []
-        self.pc = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = self.pc.Index(INDEX_NAME)
+        self.embedding_cache = None
+        self.vector_store = get_vector_store()
         # Load local embedding model
         print("Loading embedding model...")
         try:
-            # Try using huggingface_hub directly to download
-            from huggingface_hub import hf_hub_download, snapshot_download
-            cache_dir = "./models_cache"
-            os.makedirs(cache_dir, exist_ok=True)
-            
-            # Download the model snapshot first
-            model_path = snapshot_download(
-                repo_id="sentence-transformers/all-MiniLM-L6-v2",
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-            print(f"Model downloaded to: {model_path}")
-            
-            # Now load the model from the local path
-            self.model = SentenceTransformer(model_path)
+            # Shared with the query-side classes, so the model is loaded once per process
+            self.model = get_embedding_model()
             print("Model loaded successfully!")
             
         except Exception as e:
@@ -62,6 +51,18 @@ class KnowledgeBase:
             
             self.model = SimpleEmbedder()
 
+        # Only cache vectors from the real model; the TF-IDF fallback is refit per call
+        model_id = getattr(self.model, "registry_id", None)
+        if EMBEDDING_CACHE_ENABLED and model_id:
+            try:
+                self.embedding_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH,
+                    model_id=model_id,
+                    max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+                )
+            except Exception as e:
+                print(f"Embedding cache disabled: {e}")
+
     def clean_html(self, html_content):
         soup = BeautifulSoup(html_content, 'html.parser')
         for script in soup(["script", "style"]):
@@ -91,6 +92,12 @@ class KnowledgeBase:
             print(f"Error fetching page {page_id}: {response.status_code}")
             return None
 
+    def encode_chunks(self, chunks):
+        """Embed chunks, reusing vectors from the on-disk cache when available"""
+        if self.embedding_cache:
+            return self.embedding_cache.encode(self.model, chunks)
+        return self.model.encode(chunks)
+
     def chunk_text(self, text, chunk_size=1000, overlap=100):
         chunks = []
         start = 0
@@ -103,13 +110,14 @@ class KnowledgeBase:
     def upload_to_pinecone(self):
         print("\n--- UPLOADING TO PINECONE ---")
         records = []
+        overlap = 100
         
         for doc in self.documents:
             print(f"Processing: {doc['source']}")
-            chunks = self.chunk_text(doc['content'])
+            chunks = self.chunk_text(doc['content'], overlap=overlap)
             
             # Generate embeddings for all chunks at once
-            embeddings = self.model.encode(chunks)
+            embeddings = self.encode_chunks(chunks)
             
             for i, chunk in enumerate(chunks):
                 record_id = str(uuid.uuid4())
@@ -121,7 +129,8 @@ class KnowledgeBase:
                     "metadata": {
                         "chunk_text": chunk,
                         "source": doc['source'],
-                        "chunk_index": i
+                        "chunk_index": i,
+                        "chunk_overlap": overlap
                     }
                 }
                 records.append(record)
@@ -132,10 +141,13 @@ class KnowledgeBase:
             batch = records[i:i+batch_size]
             print(f"Upserting batch {i//batch_size + 1}...")
             try:
-                self.index.upsert(vectors=batch)
+                self.vector_store.upsert(batch)
+                bump_index_generation()
             except Exception as e:
                 print(f"Error upserting batch: {e}")
 
+        if self.embedding_cache:
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
         print("--- UPLOAD COMPLETE ---")
 
     def run_pipeline(self):
@@ -146,5 +158,5 @@ class KnowledgeBase:
             if doc:
                 self.documents.append(doc)
 
-        # 2. Upload to Pinecone
+        # 2. Upload to the vector store
         self.upload_to_pinecone()
@@ -0,0 +1,219 @@
+import re
+import threading
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.metrics import Distribution
+from services.context_packer import CHARS_PER_TOKEN
+
+# The static part of every answer prompt. It is registered once as (part of)
+# the agent's instructions, so each turn only sends its context and question.
+TICKET_RULES = """CRITICAL INSTRUCTION FOR JIRA TICKETS:
+You have access to a 'create_ticket' tool that creates Jira tickets.
+
+WHEN TO CREATE TICKETS:
+
+1. **User Explicitly Requests a Ticket:**
+   - If the user says "create a ticket", "raise a ticket", "I want to raise a ticket", etc.
+   - FIRST ask: "I'd be happy to create a ticket for you. Could you please provide:
+     - A brief summary of the issue
+     - A detailed description of what you're experiencing"
+   - WAIT for the user to provide this information
+   - ONLY create the ticket after you have both summary and description from the user
+   - DO NOT create a ticket without getting this information first
+
+2. **After Attempting to Help (Automatic Creation):**
+   - If you already provided troubleshooting steps or suggestions from the documentation
+   - AND the user indicates the issue is still not resolved
+   - AND you have enough context about their issue from the conversation
+   - THEN automatically create a ticket with:
+     - Summary: Based on the user's issue
+     - Description: Include the issue details, steps already tried, and why it couldn't be resolved
+    Execute the 'create_ticket' tool immediately.Inform the user: "I've created ticket [TICKET_KEY] to track this issue. Our team will investigate and get back to you."
+
+3. **When NOT to Create Tickets:**
+   - If you can answer the question from the documentation → Just provide the answer
+   - If the user just asked a question → Try to help first, don't immediately create a ticket
+   - If you don't have enough information about the issue → Ask clarifying questions first
+
+General Instructions:
+- ALWAYS try to help the user first using the available documentation
+- Only create tickets when you've attempted to help but couldn't resolve the issue, OR when explicitly requested by the user with proper details
+- Be helpful and conversational - don't jump straight to ticket creation"""
+
+RESPONSE_FORMAT = """IMPORTANT: You must return a valid JSON object as your final response.
+If you use a tool, the tool call happens automatically. Your final response after the tool execution (or if no tool is used) must be the JSON object.
+
+The JSON object must have two keys:
+1. "answer": The natural language answer to the user. If you created a Jira ticket, mention the ticket key in your response.
+2. "used_source_indices": A list of integer indices (e.g. [0, 2]) of the context items that were actually used to generate the answer. If no context was used, return an empty list.
+
+Example format when creating a ticket:
+{
+  "answer": "I couldn't find information about that in our documentation, so I've created ticket PROJ-123 to track this issue. Our team will investigate and get back to you.",
+  "used_source_indices": []
+}
+
+Example format when answering from context:
+{
+  "answer": "Based on our documentation, here's the answer...",
+  "used_source_indices": [0, 2]
+}"""
+
+# Delimit our block inside the agent's instructions, so a restart replaces it
+# and instructions maintained elsewhere (e.g. in the portal) are kept
+INSTRUCTIONS_BEGIN = "<!-- knowledge-base answer instructions: begin -->"
+INSTRUCTIONS_END = "<!-- knowledge-base answer instructions: end -->"
+
+AGENT_INSTRUCTIONS = f"""{INSTRUCTIONS_BEGIN}
+You answer questions using context from the company's documentation, which each user message provides as numbered items.
+
+{TICKET_RULES}
+
+{RESPONSE_FORMAT}
+{INSTRUCTIONS_END}"""
+
+# Replaces the agent's instructions for title runs, which must not answer in JSON
+TITLE_INSTRUCTIONS = "You write short, concise titles for conversations. Reply with the title only."
+
+TURN_INTRO = "Use the following context from the company's documentation to answer the user's question."
+
+
+def merge_instructions(existing):
+    """The agent's instructions with our block added, or replacing the version registered before"""
+    existing = existing or ""
+    start = existing.find(INSTRUCTIONS_BEGIN)
+    end = existing.find(INSTRUCTIONS_END)
+    if start != -1 and end > start:
+        existing = existing[:start] + existing[end + len(INSTRUCTIONS_END):]
+    existing = existing.strip()
+    return f"{existing}\n\n{AGENT_INSTRUCTIONS}" if existing else AGENT_INSTRUCTIONS
+
+
+def format_turn(context_text, query, inline_instructions=False):
+    """
+    User message for one turn. Without registered agent instructions the
+    static rules are sent inline, as the full prompt.
+    """
+    if inline_instructions:
+        return f"""{TURN_INTRO}
+
+{TICKET_RULES}
+
+Context:
+{context_text}
+
+User Question: {query}
+
+{RESPONSE_FORMAT}"""
+    return f"""{TURN_INTRO}
+
+Context:
+{context_text}
+
+User Question: {query}
+
+Reply with the JSON object described in your instructions."""
+
+
+_ANSWER_KEY = re.compile(r'"answer"\s*:\s*"')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class AnswerTextStream:
+    """
+    Incrementally extracts the "answer" string of the JSON reply (see
+    RESPONSE_FORMAT) from streamed text, so it can be shown while the rest
+    of the object is still being generated. feed() takes the next piece of
+    the reply and returns the newly decoded answer text. A reply without an
+    "answer" string yields nothing; the parsed final reply is authoritative.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None  # Index in the buffer of the next undecoded answer character
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return ""
+        self._buffer += text
+        if self._pos is None:
+            match = _ANSWER_KEY.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        out = []
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
+                continue
+            # Escape sequence; wait for the rest of it if it is split across pieces
+            if pos + 1 >= len(buffer):
+                break
+            code = buffer[pos + 1]
+            if code != 'u':
+                out.append(_ESCAPES.get(code, code))
+                pos += 2
+                continue
+            if pos + 6 > len(buffer):
+                break
+            unit = int(buffer[pos + 2:pos + 6], 16)
+            if 0xD800 <= unit < 0xDC00:
+                # High surrogate: combine with the low surrogate that follows
+                if pos + 12 > len(buffer):
+                    break
+                low = int(buffer[pos + 8:pos + 12], 16)
+                out.append(chr(0x10000 + ((unit - 0xD800) << 10) + (low - 0xDC00)))
+                pos += 12
+            else:
+                out.append(chr(unit))
+                pos += 6
+        self._pos = pos
+        return "".join(out)
+
+
+class PromptAccounting:
+    """
+    Tokens sent per turn, and the tokens saved by not repeating the static
+    instructions in every message. `count_tokens` maps a list of texts to
+    their token counts; without one, tokens are estimated from characters.
+    """
+
+    def __init__(self, count_tokens=None, instructions_registered=False):
+        self._count_tokens = count_tokens or (lambda texts: [max(1, len(text) // CHARS_PER_TOKEN) for text in texts])
+        self.instructions_registered = instructions_registered
+        self.instruction_tokens = self.count(format_turn("", "", inline_instructions=True)) - self.count(format_turn("", ""))
+        self.turn_tokens = Distribution()
+        self._lock = threading.Lock()
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+
+    def count(self, text):
+        return self._count_tokens([text])[0]
+
+    def record(self, message):
+        tokens = self.count(message)
+        self.turn_tokens.add(tokens)
+        with self._lock:
+            self.tokens_sent += tokens
+            if self.instructions_registered:
+                self.tokens_saved += self.instruction_tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                "instructions_registered": self.instructions_registered,
+                "instruction_tokens": self.instruction_tokens,
+                "tokens_sent": self.tokens_sent,
+                "tokens_saved": self.tokens_saved,
+                "turn_tokens": self.turn_tokens.summary()
+            }
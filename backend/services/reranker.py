@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.config import *
+from core.embeddings import resolve_model_dir
+from core.logger import setup_logger
+from core.metrics import Distribution
+
+logger = setup_logger('reranker')
+
+
+class Reranker:
+    """
+    Reorders retrieved matches with a small cross-encoder on CPU and keeps the
+    best top_n. Scoring runs on a worker thread under a hard budget that also
+    covers waiting for a previous call to finish scoring: if the result isn't
+    there within budget_ms, the first top_n matches in retrieval order are
+    returned instead.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL_NAME, model_path=RERANK_MODEL_PATH, top_n=RERANK_TOP_N,
+                 budget_ms=RERANK_BUDGET_MS, max_length=RERANK_MAX_LENGTH):
+        from sentence_transformers import CrossEncoder
+
+        model_dir = resolve_model_dir(model_name, model_path=model_path)
+        self.model = CrossEncoder(model_dir, max_length=max_length, device="cpu")
+        self.top_n = top_n
+        self.budget = budget_ms / 1000
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        # One scoring job at a time; a request queues for it only within its own budget
+        self._busy = threading.Semaphore(1)
+        self.latency_ms = Distribution()
+        self.reranked = 0
+        self.fallbacks = 0
+        logger.info(f"Cross-encoder loaded from {model_dir} (keep {top_n}, budget {budget_ms}ms)")
+
+    def _score(self, query, matches):
+        try:
+            pairs = [(query, match['metadata']['chunk_text']) for match in matches]
+            return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        finally:
+            self._busy.release()
+
+    def rerank(self, query, matches):
+        """Best top_n matches, each with its cross-encoder score as `rerank_score`"""
+        if len(matches) <= 1:
+            return list(matches)
+        started = time.monotonic()
+        if not self._busy.acquire(timeout=self.budget):
+            self.fallbacks += 1
+            logger.warning(f"Reranker busy for the whole {self.budget * 1000:.0f}ms budget, keeping retrieval order")
+            return list(matches[:self.top_n])
+        remaining = self.budget - (time.monotonic() - started)
+        if remaining <= 0:
+            self._busy.release()
+            self.fallbacks += 1
+            logger.warning("Reranker budget spent waiting for a previous call, keeping retrieval order")
+            return list(matches[:self.top_n])
+
+        future = self._pool.submit(self._score, query, matches)
+        try:
+            scores = future.result(timeout=remaining)
+        except FuturesTimeoutError:
+            self.fallbacks += 1
+            logger.warning(f"Rerank exceeded {self.budget * 1000:.0f}ms budget, keeping retrieval order")
+            return list(matches[:self.top_n])
+        except Exception as e:
+            self.fallbacks += 1
+            logger.error(f"Rerank failed, keeping retrieval order: {e}", exc_info=True)
+            return list(matches[:self.top_n])
+        self.latency_ms.add((time.monotonic() - started) * 1000)
+        self.reranked += 1
+
+        ranked = sorted(zip(matches, scores), key=lambda pair: pair[1], reverse=True)[:self.top_n]
+        reranked = []
+        for match, score in ranked:
+            match = dict(match)
+            match['rerank_score'] = float(score)
+            reranked.append(match)
+        return reranked
+
+    def stats(self):
+        calls = self.reranked + self.fallbacks
+        return {
+            "top_n": self.top_n,
+            "budget_ms": self.budget * 1000,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "fallback_rate": self.fallbacks / calls if calls else 0.0,
+            "latency_ms": self.latency_ms.summary()
+        }
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from core.config import *
+from core.cache import LRUCache
+from core.index_state import index_generation
+
+
+def normalize_query(query, lowercase=False):
+    """
+    Spacing never changes the vector; case only doesn't for an uncased model,
+    so lowercase only when the model's tokenizer does
+    """
+    query = " ".join(query.split())
+    return query.lower() if lowercase else query
+
+
+def vector_key(vector):
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()
+
+
+class RetrievalCache:
+    """
+    Two cache layers in front of the query path:
+    - normalized query text -> query vector (skips the embedding model); the
+      text is lowercased only with `lowercase`, for an uncased model
+    - (vector key, top_k, filters, index generation) -> matches (skips Pinecone)
+
+    Result keys include the index generation, which ingestion bumps whenever it
+    writes to the index, so results cached before a reindex are never served.
+    """
+
+    def __init__(self, vector_entries=QUERY_VECTOR_CACHE_SIZE, vector_ttl=QUERY_VECTOR_CACHE_TTL,
+                 result_entries=RETRIEVAL_CACHE_SIZE, result_ttl=RETRIEVAL_CACHE_TTL, lowercase=False):
+        self.lowercase = lowercase
+        self.vectors = LRUCache(vector_entries, ttl=vector_ttl)
+        self.results = LRUCache(result_entries, ttl=result_ttl)
+
+    def get_vector(self, query):
+        return self.vectors.get(normalize_query(query, self.lowercase))
+
+    def put_vector(self, query, vector):
+        self.vectors.put(normalize_query(query, self.lowercase), vector)
+
+    @staticmethod
+    def results_key(vector, top_k, filters=None):
+        """
+        Take the key before querying the index: the generation it captures is the
+        one the results belong to, even if ingestion bumps it mid-query.
+        """
+        filters_key = json.dumps(filters, sort_keys=True, default=str) if filters else None
+        return vector_key(vector), top_k, filters_key, index_generation()
+
+    def get_matches(self, key):
+        matches = self.results.get(key)
+        return list(matches) if matches is not None else None
+
+    def put_matches(self, key, matches):
+        self.results.put(key, list(matches))
+
+    def stats(self):
+        return {
+            "index_generation": index_generation(),
+            "query_vectors": self.vectors.stats(),
+            "retrieval_results": self.results.stats()
+        }
@@ -0,0 +1,98 @@
+import asyncio
+import re
+from typing import Dict, Optional
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.config import *
+from core.logger import setup_logger
+
+logger = setup_logger('title_jobs')
+
+# Greetings and request phrasing that carry no topic
+_PREAMBLE = re.compile(r"^(?:(?:hi|hello|hey)\b[\s,!.]*)?(?:(?:please|can you|could you|i need to|i want to)\s+)?", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def extractive_title(first_message: str, max_words: int = 7) -> str:
+    """
+    Immediate title taken from the first question itself: its first sentence
+    without greeting or trailing punctuation, at most max_words words
+    """
+    text = " ".join(first_message.split())
+    text = _SENTENCE_END.split(text, maxsplit=1)[0]
+    text = _PREAMBLE.sub("", text).strip(" ?!.,;:")
+    words = text.split()
+    if not words:
+        return "New Conversation"
+    title = " ".join(words[:max_words])
+    if len(words) > max_words:
+        title += "..."
+    return title[0].upper() + title[1:]
+
+
+class TitleJobs:
+    """
+    Generates conversation titles in the background, after the first answer
+    has been sent. At most `max_concurrent` generations run at once; past
+    `max_pending` queued or running jobs new ones are not started and the
+    conversation keeps its extractive title. `generate(first_message)` is the
+    coroutine producing a title, `on_title(thread_id, title)` receives it.
+    Must be used from the event loop.
+    """
+
+    def __init__(self, generate, on_title, max_concurrent=TITLE_MAX_CONCURRENT, max_pending=TITLE_MAX_PENDING):
+        self._generate = generate
+        self._on_title = on_title
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        # Tasks are referenced until done, so they aren't garbage collected mid-run
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def schedule(self, thread_id: str, first_message: str) -> bool:
+        """Start generating a title for a conversation; False if the backlog is full"""
+        if thread_id in self._tasks:
+            return True
+        if len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"Title backlog full ({self.max_pending}), keeping extractive title for {thread_id}")
+            return False
+        task = asyncio.get_running_loop().create_task(self._run(thread_id, first_message))
+        self._tasks[thread_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(thread_id, None))
+        return True
+
+    async def _run(self, thread_id: str, first_message: str):
+        title: Optional[str] = None
+        try:
+            async with self._slots:
+                title = await self._generate(first_message)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Title generation failed for {thread_id}: {e}", exc_info=True)
+        self._on_title(thread_id, title)
+
+    def is_pending(self, thread_id: str) -> bool:
+        return thread_id in self._tasks
+
+    async def aclose(self):
+        """Cancel title jobs still queued or running"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self):
+        return {
+            "pending": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_concurrent": self.max_concurrent,
+            "max_pending": self.max_pending
+        }